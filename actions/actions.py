@@ -19,8 +19,10 @@ import sys
 
 sys.path.append('hooks/')
 
-from charmhelpers.core.hookenv import action_fail
+from charmhelpers.contrib.openstack.utils import git_install_requested
+from charmhelpers.core.hookenv import action_fail, config
 from horizon_utils import (
+    git_post_install_late,
     pause_unit_helper,
     resume_unit_helper,
     register_configs,
@@ -40,9 +42,19 @@ def resume(args):
     resume_unit_helper(register_configs())
 
 
+def rebuild_static(args):
+    """Rebuild the static assets of a git install, even if their inputs
+    are unchanged since the last build."""
+    if not git_install_requested():
+        action_fail('openstack-origin-git is not configured')
+        return
+    git_post_install_late(config('openstack-origin-git'), force=True)
+
+
 # A dictionary of all the defined actions to callables (which take
 # parsed arguments).
-ACTIONS = {"pause": pause, "resume": resume}
+ACTIONS = {"pause": pause, "resume": resume,
+           "rebuild-static": rebuild_static}
 
 
 def main(args):
@@ -28,6 +28,8 @@ from charmhelpers.core.hookenv import (
 from charmhelpers.contrib.openstack.context import (
     OSContextGenerator,
     HAProxyContext,
+    SharedDBContext,
+    WorkerConfigContext,
     context_complete
 )
 from charmhelpers.contrib.openstack.utils import (
@@ -45,7 +47,11 @@ from charmhelpers.contrib.network.ip import (
     format_ipv6_addr,
 )
 
-from charmhelpers.core.host import pwgen
+from charmhelpers.core.host import (
+    cmp_pkgrevno,
+    get_total_ram,
+    pwgen,
+)
 
 from base64 import b64decode
 import os
@@ -56,6 +62,182 @@ VALID_ENDPOINT_TYPES = {
     'ADMINURL': 'adminURL',
 }
 
+VALID_HAPROXY_MODES = ['tcp', 'http']
+HAPROXY_COOKIE = 'SERVERID'
+# haproxy.cfg's default when haproxy-server-timeout is not set
+HAPROXY_SERVER_TIMEOUT = 30000
+
+VALID_SSL_TERMINATIONS = ['apache', 'haproxy']
+SSL_CERT = '/etc/ssl/certs/dashboard.cert'
+SSL_KEY = '/etc/ssl/private/dashboard.key'
+SNAKEOIL_CERT = '/etc/ssl/certs/ssl-cert-snakeoil.pem'
+SNAKEOIL_KEY = '/etc/ssl/private/ssl-cert-snakeoil.key'
+CA_CERT_FILE = '/usr/local/share/ca-certificates/keystone_juju_ca_cert.crt'
+HAPROXY_PEM = '/etc/haproxy/dashboard.pem'
+# Sessions held in haproxy's TLS session cache, and their lifetime in seconds
+HAPROXY_SSL_CACHE_SIZE = 20000
+HAPROXY_SSL_LIFETIME = 300
+
+# mod_wsgi daemon sizing used when worker-multiplier is not set
+DEFAULT_WSGI_PROCESSES = 3
+DEFAULT_WSGI_THREADS = 10
+MAX_WSGI_THREADS = 64
+# Share of the unit's RAM the mod_wsgi daemon processes may use
+WSGI_RAM_FRACTION = 0.5
+# Expected size in MB of a mod_wsgi daemon process, the option's default
+DEFAULT_WSGI_PROCESS_MEMORY = 256
+# apache2 event MPM sizing; the minimum matches the distro default
+MPM_THREADS_PER_CHILD = 25
+MIN_MPM_WORKERS = 150
+
+VALID_SESSION_ENGINES = ['signed_cookies', 'cache', 'cached_db', 'db']
+DB_SESSION_ENGINES = ['cached_db', 'db']
+VALID_IMAGE_UPLOAD_MODES = ['direct', 'legacy', 'off']
+VALID_LOG_LEVELS = ['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL']
+
+# Django's default FILE_UPLOAD_MAX_MEMORY_SIZE
+FILE_UPLOAD_MAX_MEMORY_SIZE = 2621440
+
+# Lifetime of compressed bundles, whose names carry a content hash
+STATIC_IMMUTABLE_MAX_AGE = 31536000
+
+MEMCACHED_PORT = 11211
+MEMCACHED_BACKEND = 'django.core.cache.backends.memcached.MemcachedCache'
+PYLIBMC_BACKEND = 'django.core.cache.backends.memcached.PyLibMCCache'
+CACHE_BACKENDS = {
+    'python-memcache': MEMCACHED_BACKEND,
+    'pylibmc': PYLIBMC_BACKEND,
+}
+MEMCACHED_SOCKET = '/var/lib/memcached/memcached.sock'
+MIN_MEMCACHED_MEMORY = 64
+MIN_MEMCACHED_CONNECTIONS = 1024
+
+
+def get_local_address():
+    '''
+    Address this unit is reachable on by its cluster peers
+    '''
+    if config('prefer-ipv6'):
+        return get_ipv6_addr(exc_list=[config('vip')])[0]
+    return unit_get('private-address')
+
+
+def get_cache_backend():
+    """
+    Returns the memcached client library Django should use.
+
+    :raises: Exception if the cache-backend option is not valid.
+    :return (string): 'python-memcache' or 'pylibmc'.
+    """
+    if config('memcached-ring'):
+        # ketama consistent hashing is only available through pylibmc
+        return 'pylibmc'
+
+    backend = config('cache-backend')
+    if backend not in CACHE_BACKENDS:
+        msg = ('Cache backend specified %s is not a valid'
+               ' cache backend' % backend)
+        log(msg, ERROR)
+        raise Exception(msg)
+
+    return backend
+
+
+def get_ssl_termination():
+    """
+    Returns the service terminating TLS for the dashboard.
+
+    haproxy only terminates TLS from 1.5 onwards; apache2 is used instead
+    on older releases.
+
+    :raises: Exception if the ssl-termination option is not valid.
+    :return (string): 'apache' or 'haproxy'.
+    """
+    termination = config('ssl-termination')
+    if termination not in VALID_SSL_TERMINATIONS:
+        msg = ('SSL termination specified %s is not a valid'
+               ' ssl termination' % termination)
+        log(msg, ERROR)
+        raise Exception(msg)
+
+    if termination == 'haproxy' and cmp_pkgrevno('haproxy', '1.5') < 0:
+        log('haproxy < 1.5 cannot terminate TLS, leaving it to apache2',
+            level=WARNING)
+        return 'apache'
+
+    return termination
+
+
+def get_memcached_socket():
+    ''' Path of the memcached unix socket, or None when TCP is in use '''
+    if not config('memcached-socket'):
+        return None
+    if config('memcached-ring'):
+        log('memcached-socket is ignored as memcached-ring requires '
+            'memcached to be reachable over TCP by cluster peers',
+            level=WARNING)
+        return None
+    return MEMCACHED_SOCKET
+
+
+def http2_enabled():
+    ''' Whether the apache2 SSL vhost should offer HTTP/2 '''
+    if not config('http2'):
+        return False
+    # mod_http2 first shipped with apache2 2.4.17
+    if cmp_pkgrevno('apache2', '2.4.17') < 0:
+        log('http2 requires apache2 2.4.17 or later, not enabling it',
+            level=WARNING)
+        return False
+    return True
+
+
+def get_swift_chunk_size():
+    """
+    Returns the chunk size, in bytes, used to stream objects to and from
+    Swift, as set by the swift-chunk-size option.
+
+    :return (int): the chunk size in bytes, or None to keep the release's
+                   default.
+    """
+    if not config('swift-chunk-size'):
+        return None
+    return config('swift-chunk-size') * 1024
+
+
+def get_file_upload_max_memory_size():
+    """
+    Returns the largest upload, in bytes, Django holds in memory rather than
+    spooling to disk.
+
+    This follows the Swift chunk size so that an upload is streamed on in
+    chunks of the size it was buffered in, but is never lowered below
+    Django's own default.
+
+    :return (int): the size in bytes, or None to keep Django's default.
+    """
+    chunk = get_swift_chunk_size()
+    if not chunk or chunk <= FILE_UPLOAD_MAX_MEMORY_SIZE:
+        return None
+    return chunk
+
+
+def get_cluster_hosts():
+    '''
+    Map of unit name to address for this unit and its cluster peers
+    '''
+    cluster_hosts = {}
+    l_unit = local_unit().replace('/', '-')
+    cluster_hosts[l_unit] = get_local_address()
+
+    for rid in relation_ids('cluster'):
+        for unit in related_units(rid):
+            _unit = unit.replace('/', '-')
+            addr = relation_get('private-address', rid=rid, unit=unit)
+            cluster_hosts[_unit] = addr
+
+    return cluster_hosts
+
 
 class HorizonHAProxyContext(HAProxyContext):
     def __call__(self):
@@ -64,18 +246,7 @@ class HorizonHAProxyContext(HAProxyContext):
         in the openstack dashboard charm so a single instance just
         self refers
         '''
-        cluster_hosts = {}
-        l_unit = local_unit().replace('/', '-')
-        if config('prefer-ipv6'):
-            cluster_hosts[l_unit] = get_ipv6_addr(exc_list=[config('vip')])[0]
-        else:
-            cluster_hosts[l_unit] = unit_get('private-address')
-
-        for rid in relation_ids('cluster'):
-            for unit in related_units(rid):
-                _unit = unit.replace('/', '-')
-                addr = relation_get('private-address', rid=rid, unit=unit)
-                cluster_hosts[_unit] = addr
+        cluster_hosts = get_cluster_hosts()
 
         log('Ensuring haproxy enabled in /etc/default/haproxy.')
         with open('/etc/default/haproxy', 'w') as out:
@@ -87,10 +258,90 @@ class HorizonHAProxyContext(HAProxyContext):
                 'dash_insecure': [80, 70],
                 'dash_secure': [443, 433]
             },
-            'prefer_ipv6': config('prefer-ipv6')
+            'prefer_ipv6': config('prefer-ipv6'),
+            'http_services': [],
+            'server_options': {
+                'dash_insecure': 'check',
+                'dash_secure': 'check',
+            },
         }
+
+        terminate_ssl = get_ssl_termination() == 'haproxy'
+        if terminate_ssl:
+            # haproxy decrypts and passes plain HTTP on to apache2
+            ctxt['service_ports']['dash_secure'] = [443, 70]
+            ctxt.update({
+                'ssl_cache_size': HAPROXY_SSL_CACHE_SIZE,
+                'ssl_lifetime': HAPROXY_SSL_LIFETIME,
+                'ssl_redirect': config('enforce-ssl'),
+            })
+
+        if config('haproxy-http-check'):
+            ctxt['health_check_path'] = '%s/auth/login/' % (
+                config('webroot').rstrip('/'))
+            check = 'check inter %d rise %d fall %d' % (
+                config('haproxy-check-interval'),
+                config('haproxy-check-rise'),
+                config('haproxy-check-fall'))
+            if config('haproxy-slowstart'):
+                check += ' slowstart %d' % config('haproxy-slowstart')
+            # The secure backend only speaks TLS; check it over TLS where
+            # haproxy supports it, and via the plain HTTP port otherwise.
+            if terminate_ssl:
+                secure_check = check
+            elif cmp_pkgrevno('haproxy', '1.5') >= 0:
+                secure_check = check + ' check-ssl verify none'
+            else:
+                secure_check = check + ' port 70'
+            ctxt['server_options'] = {
+                'dash_insecure': check,
+                'dash_secure': secure_check,
+            }
+
+        if self.haproxy_mode() == 'http' or terminate_ssl:
+            # HTTPS can only be inspected when TLS terminates in haproxy
+            ctxt['http_services'] = ['dash_insecure']
+            if terminate_ssl:
+                ctxt['http_services'].append('dash_secure')
+
+            # NOTE: limit each server to the requests its mod_wsgi daemon
+            # can serve at once so bursts queue in haproxy rather than in
+            # apache2; queued requests may wait as long as a request may
+            # run unless haproxy-queue-timeout says otherwise.
+            wsgi = WSGIWorkerConfigContext().daemon_size()
+            maxconn = wsgi['wsgi_processes'] * wsgi['wsgi_threads']
+            for service in ctxt['http_services']:
+                ctxt['server_options'][service] += ' maxconn %d' % maxconn
+            ctxt.update({
+                'haproxy_queue_timeout': (config('haproxy-server-timeout') or
+                                          HAPROXY_SERVER_TIMEOUT),
+                'haproxy_cookie': HAPROXY_COOKIE,
+                # server side keep-alive needs haproxy >= 1.5 and
+                # connection reuse >= 1.6
+                'haproxy_http_keepalive': cmp_pkgrevno('haproxy',
+                                                       '1.5') >= 0,
+                'haproxy_http_reuse': cmp_pkgrevno('haproxy', '1.6') >= 0,
+            })
+
         return ctxt
 
+    @staticmethod
+    def haproxy_mode():
+        """
+        Returns the proxy mode selected by the haproxy-mode option.
+
+        :raises: Exception if the mode is not valid.
+        :return (string): 'tcp' or 'http'.
+        """
+        mode = config('haproxy-mode')
+        if mode not in VALID_HAPROXY_MODES:
+            msg = ('HAProxy mode specified %s is not a valid'
+                   ' haproxy mode' % mode)
+            log(msg, ERROR)
+            raise Exception(msg)
+
+        return mode
+
 
 # NOTE: this is a stripped-down version of
 # contrib.openstack.IdentityServiceContext
@@ -174,6 +425,73 @@ class IdentityServiceContext(OSContextGenerator):
 
 
 class HorizonContext(OSContextGenerator):
+    @staticmethod
+    def session_engine():
+        """
+        Returns the Django session engine selected by the session-engine
+        option, or None to keep the release's implicit choice.
+
+        :raises: Exception if the session engine is not valid.
+        :return (string): the session engine.
+        """
+        engine = config('session-engine')
+        if not engine:
+            return None
+
+        if engine not in VALID_SESSION_ENGINES:
+            msg = ('Session engine specified %s is not a valid'
+                   ' session engine' % engine)
+            log(msg, ERROR)
+            raise Exception(msg)
+
+        if engine in DB_SESSION_ENGINES and not relation_ids('shared-db'):
+            log('Session engine %s requires the shared-db relation' % engine,
+                level=WARNING)
+
+        return engine
+
+    @staticmethod
+    def image_upload_mode():
+        """
+        Returns the image upload mode selected by the image-upload-mode
+        option, or None to keep the release's default.
+
+        :raises: Exception if the image upload mode is not valid.
+        :return (string): the image upload mode.
+        """
+        mode = config('image-upload-mode')
+        if not mode:
+            return None
+
+        if mode not in VALID_IMAGE_UPLOAD_MODES:
+            msg = ('Image upload mode specified %s is not a valid'
+                   ' image upload mode' % mode)
+            log(msg, ERROR)
+            raise Exception(msg)
+
+        return mode
+
+    @staticmethod
+    def log_levels():
+        """
+        Parses the log-levels option, a space or comma separated list of
+        logger=LEVEL pairs.
+
+        :raises: Exception if a pair or level is not valid.
+        :return (list): sorted (logger, level) tuples.
+        """
+        levels = {}
+        for pair in (config('log-levels') or '').replace(',', ' ').split():
+            name, _, level = pair.partition('=')
+            level = level.upper()
+            if not name or level not in VALID_LOG_LEVELS:
+                msg = ('Log level specified %s is not a valid'
+                       ' logger=LEVEL pair' % pair)
+                log(msg, ERROR)
+                raise Exception(msg)
+            levels[name] = level
+        return sorted(levels.items())
+
     def __call__(self):
         ''' Provide all configuration for Horizon '''
         projects_yaml = git_default_repos(config('openstack-origin-git'))
@@ -195,6 +513,20 @@ class HorizonContext(OSContextGenerator):
             "cinder_backup": config("cinder-backup"),
             'virtualenv': git_pip_venv_dir(projects_yaml)
             if config('openstack-origin-git') else None,
+            'session_engine': self.session_engine(),
+            'secure_proxy_ssl_header': get_ssl_termination() == 'haproxy',
+            # NOTE: when unset each release's template keeps its own default
+            'api_result_limit': config('api-result-limit'),
+            'api_result_page_size': config('api-result-page-size'),
+            'dropdown_max_items': config('dropdown-max-items'),
+            'instance_retrieve_ip_addresses':
+            config('instance-retrieve-ip-addresses'),
+            'image_upload_mode': self.image_upload_mode(),
+            'swift_chunk_size': get_swift_chunk_size(),
+            'file_upload_max_memory_size': get_file_upload_max_memory_size(),
+            'file_upload_temp_dir': config('file-upload-temp-dir'),
+            'log_queue': config('log-queue'),
+            'log_levels': self.log_levels(),
         }
 
         return ctxt
@@ -205,10 +537,12 @@ class ApacheContext(OSContextGenerator):
         ''' Grab cert and key from configuraton for SSL config '''
         ctxt = {
             'http_port': 70,
-            'https_port': 433
+            'https_port': 433,
+            'http2': http2_enabled(),
         }
 
-        if config('enforce-ssl'):
+        # NOTE: haproxy redirects to https itself when it terminates TLS
+        if config('enforce-ssl') and get_ssl_termination() == 'apache':
             # NOTE(dosaboy): if ssl is not configured we shouldn't allow this
             if all(get_cert()):
                 if config('vip'):
@@ -235,15 +569,15 @@ class ApacheSSLContext(OSContextGenerator):
 
         ssl_cert, ssl_key = get_cert()
         if all([ssl_cert, ssl_key]):
-            with open('/etc/ssl/certs/dashboard.cert', 'w') as cert_out:
+            with open(SSL_CERT, 'w') as cert_out:
                 cert_out.write(b64decode(ssl_cert))
-            with open('/etc/ssl/private/dashboard.key', 'w') as key_out:
+            with open(SSL_KEY, 'w') as key_out:
                 key_out.write(b64decode(ssl_key))
-            os.chmod('/etc/ssl/private/dashboard.key', 0600)
+            os.chmod(SSL_KEY, 0600)
             ctxt = {
                 'ssl_configured': True,
-                'ssl_cert': '/etc/ssl/certs/dashboard.cert',
-                'ssl_key': '/etc/ssl/private/dashboard.key',
+                'ssl_cert': SSL_CERT,
+                'ssl_key': SSL_KEY,
             }
         else:
             # Use snakeoil ones by default
@@ -253,6 +587,241 @@ class ApacheSSLContext(OSContextGenerator):
         return ctxt
 
 
+class HAProxySSLContext(OSContextGenerator):
+    def __call__(self):
+        ''' Bundle the dashboard certificate and key for haproxy '''
+        if get_ssl_termination() != 'haproxy':
+            return {}
+
+        ssl = ApacheSSLContext()()
+        if ssl['ssl_configured']:
+            parts = [ssl['ssl_cert']]
+            ca_cert = get_ca_cert()
+            if ca_cert:
+                # haproxy needs the issuer in the chain to staple OCSP
+                parts.append(CA_CERT_FILE)
+            parts.append(ssl['ssl_key'])
+        else:
+            parts = [SNAKEOIL_CERT, SNAKEOIL_KEY]
+
+        pem = ''
+        for part in parts:
+            with open(part) as f:
+                pem += f.read().strip() + '\n'
+
+        # Only rewrite on change so haproxy is not restarted needlessly
+        current = None
+        if os.path.exists(HAPROXY_PEM):
+            with open(HAPROXY_PEM) as f:
+                current = f.read()
+        if pem != current:
+            # holds the private key, so never readable by others, even
+            # briefly
+            fd = os.open(HAPROXY_PEM, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                         0o600)
+            os.fchmod(fd, 0o600)
+            with os.fdopen(fd, 'w') as out:
+                out.write(pem)
+
+        return {'ssl_pem': HAPROXY_PEM}
+
+
+class ApacheStaticContext(OSContextGenerator):
+    def __call__(self):
+        ''' Browser caching of the static assets served by apache2 '''
+        return {
+            'static_max_age': max(config('static-cache-max-age') or 0, 0),
+            'static_immutable_max_age': STATIC_IMMUTABLE_MAX_AGE,
+            'static_precompression': config('static-precompression'),
+        }
+
+
+class WSGIWorkerConfigContext(WorkerConfigContext):
+    def __call__(self):
+        ''' Size the horizon mod_wsgi daemon from the unit's CPU and RAM '''
+        ctxt = self.timeouts()
+        ctxt.update(self.daemon_size())
+        return ctxt
+
+    def daemon_size(self):
+        ''' Processes and threads of the horizon mod_wsgi daemon '''
+        multiplier = config('worker-multiplier') or 0
+        if multiplier <= 0:
+            return {
+                'wsgi_processes': DEFAULT_WSGI_PROCESSES,
+                'wsgi_threads': DEFAULT_WSGI_THREADS,
+            }
+
+        processes = max(int(self.num_cpus * multiplier), 1)
+        threads = DEFAULT_WSGI_THREADS
+
+        # NOTE: each daemon process holds a full copy of Django and the
+        # dashboards, so bound the process count by RAM and make up the
+        # difference in concurrency with threads.
+        process_memory = config('wsgi-process-memory') or 0
+        if process_memory <= 0:
+            log('wsgi-process-memory must be greater than 0, using %d MB' %
+                DEFAULT_WSGI_PROCESS_MEMORY, level=WARNING)
+            process_memory = DEFAULT_WSGI_PROCESS_MEMORY
+        process_memory *= 1024 * 1024
+        max_processes = max(
+            int(get_total_ram() * WSGI_RAM_FRACTION / process_memory), 1)
+        if processes > max_processes:
+            log('Limiting mod_wsgi to %d processes (%d requested) to fit '
+                'in available RAM' % (max_processes, processes),
+                level=WARNING)
+            threads = min(threads * processes // max_processes,
+                          MAX_WSGI_THREADS)
+            processes = max_processes
+
+        return {
+            'wsgi_processes': processes,
+            'wsgi_threads': threads,
+        }
+
+    @staticmethod
+    def timeouts():
+        ''' Request timeouts and process recycling for the daemon '''
+        ctxt = {
+            'wsgi_inactivity_timeout': config('wsgi-inactivity-timeout'),
+            'wsgi_maximum_requests': config('wsgi-maximum-requests'),
+        }
+        # queue-timeout, request-timeout and graceful-timeout are only
+        # understood by mod_wsgi 4.1 and later; apache2 refuses to start on
+        # unknown WSGIDaemonProcess options.
+        if cmp_pkgrevno('libapache2-mod-wsgi', '4.1') >= 0:
+            ctxt.update({
+                'wsgi_queue_timeout': config('wsgi-queue-timeout'),
+                'wsgi_request_timeout': config('wsgi-request-timeout'),
+                'wsgi_graceful_timeout': config('wsgi-graceful-timeout'),
+            })
+        elif config('wsgi-request-timeout') or config('wsgi-queue-timeout'):
+            log('mod_wsgi < 4.1 does not support queue or request timeouts, '
+                'not setting them', level=WARNING)
+        return {k: v for k, v in ctxt.iteritems() if v and v > 0}
+
+
+class ApacheMPMContext(WorkerConfigContext):
+    def __call__(self):
+        ''' Size the apache2 event MPM in front of the mod_wsgi daemon '''
+        # NOTE: a request handed to the mod_wsgi daemon holds an apache2
+        # worker thread until it completes; leave as many again for static
+        # assets and requests queued for the daemon, so apache2 is never
+        # the bottleneck before Django is. Idle keep-alive connections are
+        # parked by the event MPM and do not use a worker.
+        wsgi = WSGIWorkerConfigContext().daemon_size()
+        workers = max(wsgi['wsgi_processes'] * wsgi['wsgi_threads'] * 2,
+                      self.num_cpus * MPM_THREADS_PER_CHILD,
+                      MIN_MPM_WORKERS)
+        servers = -(-workers // MPM_THREADS_PER_CHILD)
+        workers = servers * MPM_THREADS_PER_CHILD
+        return {
+            'mpm_threads_per_child': MPM_THREADS_PER_CHILD,
+            'mpm_server_limit': servers,
+            'mpm_max_request_workers': workers,
+            'mpm_max_spare_threads': max(workers // 2,
+                                         MPM_THREADS_PER_CHILD * 3),
+            'keepalive_timeout': config('apache-keepalive-timeout'),
+        }
+
+
+class HorizonSharedDBContext(SharedDBContext):
+    def __call__(self):
+        ''' Database settings with persistent connections for sessions '''
+        ctxt = super(HorizonSharedDBContext, self).__call__()
+        if not ctxt:
+            return ctxt
+
+        # NOTE: Django keeps one connection per mod_wsgi thread open for
+        # CONN_MAX_AGE seconds, so each unit may hold this many connections
+        # to the database at once.
+        wsgi = WSGIWorkerConfigContext().daemon_size()
+        ctxt['database_conn_max_age'] = max(
+            config('database-conn-max-age') or 0, 0)
+        ctxt['database_max_connections'] = (wsgi['wsgi_processes'] *
+                                            wsgi['wsgi_threads'])
+        return ctxt
+
+
+class CacheContext(OSContextGenerator):
+    def __call__(self):
+        ''' Django cache configuration for local_settings.py '''
+        backend = get_cache_backend()
+        socket = get_memcached_socket()
+
+        if config('memcached-ring'):
+            # NOTE: every unit must render the same server list so that a
+            # key maps to the same memcached instance whichever unit serves
+            # the request; ketama hashing keeps remapping to a minimum as
+            # units join and leave the cluster.
+            servers = []
+            for addr in get_cluster_hosts().values():
+                if addr:
+                    addr = format_ipv6_addr(addr) or addr
+                    servers.append('%s:%d' % (addr, MEMCACHED_PORT))
+        elif socket:
+            # pylibmc takes a bare path for unix sockets
+            if backend == 'pylibmc':
+                servers = [socket]
+            else:
+                servers = ['unix:%s' % socket]
+        else:
+            servers = ['127.0.0.1:%d' % MEMCACHED_PORT]
+
+        options = {}
+        if backend == 'pylibmc':
+            # Passed to pylibmc as libmemcached behaviors
+            options['ketama'] = True
+            if not socket:
+                options['tcp_nodelay'] = True
+
+        return {
+            'cache_backend': CACHE_BACKENDS[backend],
+            'cache_servers': sorted(servers),
+            'cache_options': options,
+        }
+
+
+class MemcachedContext(WorkerConfigContext):
+    def __call__(self):
+        ''' Configuration for the local memcached instance '''
+        memory = int(get_total_ram() / (1024 * 1024) *
+                     config('memcached-memory-fraction'))
+
+        # NOTE: python-memcache and pylibmc both hold one connection per
+        # mod_wsgi thread, and with a ring every peer connects to every
+        # memcached instance; leave headroom for reconnects.
+        wsgi = WSGIWorkerConfigContext().daemon_size()
+        units = 1
+        if config('memcached-ring'):
+            units = max(len(get_cluster_hosts()), 1)
+        connections = (wsgi['wsgi_processes'] * wsgi['wsgi_threads'] *
+                       units * 2)
+
+        ctxt = {
+            'memcached_memory': max(memory, MIN_MEMCACHED_MEMORY),
+            'memcached_threads': max(self.num_cpus, 1),
+            'memcached_connections': max(connections,
+                                         MIN_MEMCACHED_CONNECTIONS),
+        }
+
+        socket = get_memcached_socket()
+        if socket:
+            ctxt['memcached_socket'] = socket
+            return ctxt
+
+        listen = ['127.0.0.1']
+        if config('memcached-ring'):
+            # Cluster peers use this instance as part of the cache ring
+            listen.append(get_local_address())
+
+        ctxt.update({
+            'memcached_port': MEMCACHED_PORT,
+            'memcached_listen': ','.join(listen),
+        })
+        return ctxt
+
+
 class RouterSettingContext(OSContextGenerator):
     def __call__(self):
         ''' Enable/Disable Router Tab on horizon '''
@@ -17,9 +17,15 @@
 # vim: set ts=4:et
 
 import sys
+import time
+
+# hook start, before the charmhelpers imports below
+STARTED = time.time()
+
 from charmhelpers.core.hookenv import (
     Hooks, UnregisteredHookError,
     log,
+    DEBUG,
     open_port,
     config,
     relation_set,
@@ -30,6 +36,7 @@ from charmhelpers.core.hookenv import (
     network_get_primary_address,
     is_leader,
     local_unit,
+    hook_name,
 )
 from charmhelpers.fetch import (
     apt_update, apt_install,
@@ -37,12 +44,14 @@ from charmhelpers.fetch import (
 )
 from charmhelpers.core.host import (
     lsb_release,
+    service_reload,
 )
 from charmhelpers.contrib.openstack.utils import (
     config_value_changed,
     configure_installation_source,
     git_install_requested,
     git_pip_venv_dir,
+    is_unit_paused_set,
     openstack_upgrade_available,
     os_release,
     save_script_rc,
@@ -55,12 +64,22 @@ from horizon_utils import (
     determine_packages,
     register_configs,
     restart_map,
+    LazyConfigRenderer,
+    record_interface_status,
+    recorded_interface_status,
     services,
-    LOCAL_SETTINGS, HAPROXY_CONF,
+    LOCAL_SETTINGS, HAPROXY_CONF, MEMCACHED_CONF,
     enable_ssl,
+    enable_static_caching,
+    enable_http2,
+    enable_mpm_event,
+    setup_memcached_socket,
     do_openstack_upgrade,
     git_install,
     git_post_install_late,
+    precompile_templates,
+    precompress_static,
+    update_ocsp_response,
     setup_ipv6,
     INSTALL_DIR,
     restart_on_change,
@@ -81,7 +100,10 @@ from charmhelpers.contrib.hardening.harden import harden
 from base64 import b64decode
 
 hooks = Hooks()
-CONFIGS = register_configs()
+CONFIGS = LazyConfigRenderer(register_configs)
+# Hooks that render nothing and leave the required interfaces untouched, so
+# their status can be assessed without building CONFIGS.
+STATUS_ONLY_HOOKS = ['update-status', 'website-relation-joined']
 
 def patch_murano_dashboard_template_fix():
     import os
@@ -147,6 +169,7 @@ def install():
     status_set('maintenance', 'Git install')
     git_install(config('openstack-origin-git'))
     patch_murano_dashboard_template_fix()
+    precompile_templates()
 
 @hooks.hook('upgrade-charm')
 @restart_on_change(restart_map(), stopstart=True, sleep=3)
@@ -155,6 +178,7 @@ def upgrade_charm():
     execd_preinstall()
     apt_install(filter_installed_packages(determine_packages()), fatal=True)
     update_nrpe_config()
+    precompile_templates()
     CONFIGS.write_all()
 
 
@@ -173,10 +197,18 @@ def config_changed():
         apt_install(filter_installed_packages(['python-lesscpy']),
                     fatal=True)
 
+    # Pick up packages needed by newly enabled options, such as the
+    # pylibmc cache client.
+    apt_install(filter_installed_packages(determine_packages()), fatal=True)
+
     # Ensure default role changes are propagated to keystone
     for relid in relation_ids('identity-service'):
         keystone_joined(relid)
     enable_ssl()
+    enable_mpm_event()
+    enable_http2()
+    enable_static_caching()
+    setup_memcached_socket()
 
     if git_install_requested():
         if config_value_changed('openstack-origin-git'):
@@ -200,12 +232,17 @@ def config_changed():
     save_script_rc(**env_vars)
     update_nrpe_config()
     CONFIGS.write_all()
+    if update_ocsp_response() and not is_unit_paused_set():
+        service_reload('haproxy')
     open_port(80)
     open_port(443)
 
     if git_install_requested():
         git_post_install_late(config('openstack-origin-git'))
 
+    if config('static-precompression'):
+        precompress_static()
+
 
 @hooks.hook('identity-service-relation-joined')
 def keystone_joined(rel_id=None):
@@ -238,6 +275,10 @@ def cluster_joined(relation_id=None):
             'cluster-relation-changed')
 @restart_on_change(restart_map(), stopstart=True, sleep=3)
 def cluster_relation():
+    if config('memcached-ring'):
+        # peers are members of the shared cache ring
+        CONFIGS.write(LOCAL_SETTINGS)
+        CONFIGS.write(MEMCACHED_CONF)
     CONFIGS.write(HAPROXY_CONF)
 
 
@@ -351,6 +392,9 @@ def update_plugin_config():
 @harden()
 def update_status():
     log('Updating status.')
+    # keep the stapled OCSP response fresh
+    if update_ocsp_response() and not is_unit_paused_set():
+        service_reload('haproxy')
 
 
 @hooks.hook('shared-db-relation-joined')
@@ -392,11 +436,20 @@ def db_changed():
 
 
 def main():
+    startup = time.time() - STARTED
     try:
         hooks.execute(sys.argv)
     except UnregisteredHookError as e:
         log('Unknown hook {} - skipping.'.format(e))
-    assess_status(CONFIGS)
+    configs = None
+    if hook_name() in STATUS_ONLY_HOOKS:
+        configs = recorded_interface_status()
+    if configs is None:
+        configs = CONFIGS
+        record_interface_status(configs)
+    assess_status(configs)
+    log('Hook {} took {:.3f}s, {:.3f}s of it starting up'.format(
+        hook_name(), time.time() - STARTED, startup), level=DEBUG)
 
 
 if __name__ == '__main__':
@@ -14,18 +14,28 @@
 
 # vim: set ts=4:et
 import grp
+import gzip
+import hashlib
 import horizon_contexts
+import io
 import os
 import pwd
 import subprocess
 import shutil
+import tempfile
 import time
 from collections import OrderedDict
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 import charmhelpers.contrib.openstack.context as context
 import charmhelpers.contrib.openstack.templating as templating
 
 from charmhelpers.contrib.openstack.utils import (
+    OPENSTACK_CODENAMES,
     configure_installation_source,
     get_os_codename_install_source,
     git_install_requested,
@@ -45,9 +55,17 @@ from charmhelpers.contrib.python.packages import (
     pip_install,
 )
 from charmhelpers.core.hookenv import (
+    cache,
+    charm_dir,
     config,
-    log
+    local_unit,
+    log,
+    relation_ids,
+    ERROR,
+    INFO,
+    WARNING,
 )
+from charmhelpers.core.unitdata import kv
 from charmhelpers.core.host import (
     adduser,
     add_group,
@@ -110,10 +128,12 @@ APACHE_CONF_DIR = "/etc/apache2"
 LOCAL_SETTINGS = "/etc/openstack-dashboard/local_settings.py"
 DASHBOARD_CONF_DIR = "/etc/openstack-dashboard/"
 HAPROXY_CONF = "/etc/haproxy/haproxy.cfg"
+MEMCACHED_CONF = "/etc/memcached.conf"
 APACHE_CONF = "%s/conf.d/openstack-dashboard.conf" % (APACHE_CONF_DIR)
 APACHE_24_CONF = "%s/conf-available/openstack-dashboard.conf" \
     % (APACHE_CONF_DIR)
 PORTS_CONF = "%s/ports.conf" % (APACHE_CONF_DIR)
+MPM_EVENT_CONF = "%s/mods-available/mpm_event.conf" % (APACHE_CONF_DIR)
 APACHE_24_SSL = "%s/sites-available/default-ssl.conf" % (APACHE_CONF_DIR)
 APACHE_24_DEFAULT = "%s/sites-available/000-default.conf" % (APACHE_CONF_DIR)
 APACHE_SSL = "%s/sites-available/default-ssl" % (APACHE_CONF_DIR)
@@ -123,23 +143,65 @@ ROUTER_SETTING = ('/usr/share/openstack-dashboard/openstack_dashboard/enabled/'
                   '_40_router.py')
 KEYSTONEV3_POLICY = ('/usr/share/openstack-dashboard/openstack_dashboard/conf/'
                      'keystonev3_policy.json')
+STATIC_DIR = '/usr/share/openstack-dashboard/openstack_dashboard/static'
+# Text assets worth serving precompressed, and the smallest worth the bother
+PRECOMPRESS_EXTENSIONS = ('.css', '.js', '.json', '.svg', '.html', '.txt',
+                          '.map', '.eot', '.ttf')
+PRECOMPRESS_MIN_SIZE = 1024
+# Inputs to collectstatic and compress for git deploys; STATIC_DIR holds
+# their output and is left out of the fingerprint.
+STATIC_SOURCE_DIRS = [
+    '/usr/share/openstack-dashboard/openstack_dashboard',
+    '/usr/share/openstack-dashboard-ubuntu-theme',
+]
+STATIC_CONFIG_KEYS = [
+    'debug',
+    'default-theme',
+    'offline-compression',
+    'ubuntu-theme',
+    'webroot',
+]
+STATIC_FINGERPRINT_KEY = 'static-fingerprint'
+# unitdata key of the REQUIRED_INTERFACES state seen by the last full status
+# assessment, reused by hooks that do not render configs.
+INTERFACE_STATUS_KEY = 'horizon-interface-status'
+# Age in seconds after which the stapled OCSP response is refreshed
+OCSP_REFRESH_INTERVAL = 12 * 60 * 60
+# Time in seconds to wait before retrying a failed OCSP fetch
+OCSP_RETRY_INTERVAL = 60 * 60
+# Time in seconds the OCSP responder is given to answer
+OCSP_TIMEOUT = 10
+OCSP_ATTEMPT_KEY = 'ocsp-last-attempt'
 TEMPLATES = 'templates'
+# Prefix of the hookenv cache entry holding evaluated context generators;
+# relation_set() flushes entries naming the local unit.
+CONTEXT_CACHE_KEY = 'horizon-contexts'
+# Directory, under the charm dir, holding compiled Jinja2 templates.
+TEMPLATE_CACHE = '.jinja2-cache'
+# Config files whose content HorizonConfigRenderer changed during this hook,
+# in the order written; restart_on_change() restarts services from it.
+CHANGED_FILES = []
 
 CONFIG_FILES = OrderedDict([
     (LOCAL_SETTINGS, {
         'hook_contexts': [horizon_contexts.HorizonContext(),
                           horizon_contexts.IdentityServiceContext(),
                           context.SyslogContext(),
+                          horizon_contexts.CacheContext(),
                           horizon_contexts.LocalSettingsContext()],
         'services': ['apache2']
     }),
     (APACHE_CONF, {
         'hook_contexts': [horizon_contexts.HorizonContext(),
+                          horizon_contexts.WSGIWorkerConfigContext(),
+                          horizon_contexts.ApacheStaticContext(),
                           context.SyslogContext()],
         'services': ['apache2'],
     }),
     (APACHE_24_CONF, {
         'hook_contexts': [horizon_contexts.HorizonContext(),
+                          horizon_contexts.WSGIWorkerConfigContext(),
+                          horizon_contexts.ApacheStaticContext(),
                           context.SyslogContext()],
         'services': ['apache2'],
     }),
@@ -165,13 +227,22 @@ CONFIG_FILES = OrderedDict([
         'hook_contexts': [horizon_contexts.ApacheContext()],
         'services': ['apache2'],
     }),
+    (MPM_EVENT_CONF, {
+        'hook_contexts': [horizon_contexts.ApacheMPMContext()],
+        'services': ['apache2'],
+    }),
     (HAPROXY_CONF, {
         'hook_contexts': [
             horizon_contexts.HorizonHAProxyContext(),
+            horizon_contexts.HAProxySSLContext(),
             context.HAProxyContext(singlenode_mode=True),
         ],
         'services': ['haproxy'],
     }),
+    (MEMCACHED_CONF, {
+        'hook_contexts': [horizon_contexts.MemcachedContext()],
+        'services': ['memcached'],
+    }),
     (ROUTER_SETTING, {
         'hook_contexts': [horizon_contexts.RouterSettingContext()],
         'services': ['apache2'],
@@ -183,21 +254,259 @@ CONFIG_FILES = OrderedDict([
 ])
 
 
+class HorizonConfigTemplate(templating.OSConfigTemplate):
+    """
+    Config file template whose context generators are evaluated at most
+    once per hook, through a cache shared by every registered file.
+    """
+    def __init__(self, config_file, contexts, context_cache):
+        super(HorizonConfigTemplate, self).__init__(config_file, contexts)
+        self.context_cache = context_cache
+
+    def context(self):
+        cache = self.context_cache()
+        ctxt = {}
+        for context in self.contexts:
+            key = id(context)
+            if key not in cache:
+                cache[key] = context()
+            _ctxt = cache[key]
+            if _ctxt:
+                ctxt.update(_ctxt)
+                # track interfaces for every complete context.
+                for interface in context.interfaces:
+                    if interface not in self._complete_contexts:
+                        self._complete_contexts.append(interface)
+        return ctxt
+
+
+class HorizonConfigRenderer(templating.OSConfigRenderer):
+    """
+    OSConfigRenderer that evaluates each context generator once per hook
+    rather than once per config file it is attached to.
+
+    Generators of the same class and state registered against several files
+    are shared, and their results are kept in the hookenv cache until
+    relation_set() or flush() invalidates them.
+    """
+    def __init__(self, templates_dir, openstack_release):
+        super(HorizonConfigRenderer, self).__init__(templates_dir,
+                                                    openstack_release)
+        self.generators = []
+
+    def _shared(self, context):
+        for generator in self.generators:
+            if (type(generator) is type(context) and
+                    vars(generator) == vars(context)):
+                return generator
+        self.generators.append(context)
+        return context
+
+    def context_cache(self):
+        key = '%s:%s' % (CONTEXT_CACHE_KEY, local_unit())
+        return cache.setdefault(key, {})
+
+    def invalidate(self):
+        ''' Drop every cached context so the next render re-evaluates '''
+        cache.pop('%s:%s' % (CONTEXT_CACHE_KEY, local_unit()), None)
+
+    def register(self, config_file, contexts):
+        if hasattr(contexts, '__call__'):
+            contexts = [contexts]
+        contexts = [self._shared(c) for c in contexts]
+        self.templates[config_file] = HorizonConfigTemplate(
+            config_file=config_file, contexts=contexts,
+            context_cache=self.context_cache)
+        log('Registered config file: %s' % config_file, level=INFO)
+
+    def _get_tmpl_env(self):
+        if not self._tmpl_env:
+            loader = templating.get_loader(self.templates_dir,
+                                           self.openstack_release)
+            self._tmpl_env = templating.Environment(
+                loader=loader, bytecode_cache=template_bytecode_cache())
+
+    def set_release(self, openstack_release):
+        self.invalidate()
+        super(HorizonConfigRenderer, self).set_release(openstack_release)
+
+    def write(self, config_file):
+        """
+        Atomically write a single config file if its rendered content differs
+        from what is on disk, recording it in CHANGED_FILES. Raises if the
+        config file is not registered.
+        """
+        if config_file not in self.templates:
+            log('Config not registered: %s' % config_file, level=ERROR)
+            raise templating.OSConfigException
+
+        _out = self.render(config_file).encode('utf-8')
+
+        if os.path.exists(config_file):
+            with open(config_file, 'rb') as current:
+                if current.read() == _out:
+                    log('Template %s unchanged.' % config_file, level=INFO)
+                    return
+
+        _atomic_write(config_file, _out)
+        CHANGED_FILES.append(config_file)
+
+        log('Wrote template %s.' % config_file, level=INFO)
+
+
+class LazyConfigRenderer(object):
+    """
+    Stand-in for the renderer returned by factory, which is only called when
+    an attribute is first accessed, so hooks that never render and assess
+    status from RecordedInterfaceStatus do not pay for release detection and
+    template environment setup.
+    """
+    def __init__(self, factory):
+        self._factory = factory
+        self._configs = None
+
+    def __getattr__(self, name):
+        if self._configs is None:
+            self._configs = self._factory()
+        return getattr(self._configs, name)
+
+
+class RecordedInterfaceStatus(object):
+    """
+    Stand-in for the renderer in assess_status(), answering from the
+    interface status saved by record_interface_status() in an earlier hook.
+    """
+    def __init__(self, status):
+        self.status = status
+
+    def complete_contexts(self):
+        return self.status['complete']
+
+    def get_incomplete_context_data(self, interfaces):
+        return {i: data for i, data in self.status['incomplete'].items()
+                if i in interfaces}
+
+
+def record_interface_status(configs):
+    ''' Save the state of REQUIRED_INTERFACES for later status-only hooks '''
+    interfaces = [i for ifaces in REQUIRED_INTERFACES.values()
+                  for i in ifaces]
+    db = kv()
+    db.set(INTERFACE_STATUS_KEY, {
+        'complete': configs.complete_contexts(),
+        'incomplete': configs.get_incomplete_context_data(interfaces),
+    })
+    db.flush()
+
+
+def recorded_interface_status():
+    '''
+    Return the interface status saved by record_interface_status(), or None
+    if no hook has recorded it yet.
+    '''
+    status = kv().get(INTERFACE_STATUS_KEY)
+    if status is None:
+        return None
+    return RecordedInterfaceStatus(status)
+
+
+def template_bytecode_cache():
+    """
+    Return a Jinja2 bytecode cache kept under the charm dir, so templates
+    are only compiled again when their source changes, or None when not
+    running from a charm dir.
+    """
+    from jinja2 import FileSystemBytecodeCache
+    if not charm_dir():
+        return None
+    cache_dir = os.path.join(charm_dir(), TEMPLATE_CACHE)
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir, 0o700)
+    return FileSystemBytecodeCache(cache_dir)
+
+
+def precompile_templates(templates_dir=TEMPLATES):
+    """
+    Replace the template bytecode cache with freshly compiled CONFIG_FILES
+    templates for every release directory under templates_dir, when
+    precompile-templates is set, so a later release upgrade does not compile
+    them either.
+    """
+    bytecode_cache = template_bytecode_cache()
+    if not bytecode_cache:
+        return
+    # drop templates compiled from a previous charm revision
+    bytecode_cache.clear()
+    if not config('precompile-templates'):
+        return
+    names = set(os.path.basename(f) for f in CONFIG_FILES)
+    for release in OPENSTACK_CODENAMES.values():
+        if not os.path.isdir(os.path.join(templates_dir, release)):
+            continue
+        env = templating.Environment(
+            loader=templating.get_loader(templates_dir, release),
+            bytecode_cache=bytecode_cache)
+        for name in names:
+            try:
+                env.get_template(name)
+            except templating.exceptions.TemplateNotFound:
+                continue
+            except templating.exceptions.TemplateError as e:
+                log('Unable to precompile template %s for %s: %s' %
+                    (name, release, e), level=WARNING)
+
+
+def _atomic_write(path, data, perms=0o644):
+    """
+    Replace path with data so readers see either the old or the new content.
+
+    The data is written and fsynced to a temp file in the same directory,
+    which takes the owner and mode of any existing file (perms otherwise)
+    and is then renamed over path. A symlinked path is written through to
+    its target.
+    """
+    path = os.path.realpath(path)
+    dirname, basename = os.path.split(path)
+    fd, tmp = tempfile.mkstemp(prefix='.%s.' % basename, dir=dirname)
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            out.write(data)
+            out.flush()
+            os.fsync(out.fileno())
+        if os.path.exists(path):
+            st = os.stat(path)
+            os.chown(tmp, st.st_uid, st.st_gid)
+            perms = st.st_mode & 0o7777
+        os.chmod(tmp, perms)
+        os.rename(tmp, path)
+    except Exception:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    # persist the rename itself
+    dir_fd = os.open(dirname, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
 def register_configs():
     ''' Register config files with their respective contexts. '''
     release = os_release('openstack-dashboard')
-    configs = templating.OSConfigRenderer(templates_dir=TEMPLATES,
-                                          openstack_release=release)
+    configs = HorizonConfigRenderer(templates_dir=TEMPLATES,
+                                    openstack_release=release)
 
     confs = [LOCAL_SETTINGS,
              HAPROXY_CONF,
+             MEMCACHED_CONF,
              PORTS_CONF]
 
     if release >= 'mitaka':
         configs.register(KEYSTONEV3_POLICY,
                          CONFIG_FILES[KEYSTONEV3_POLICY]['hook_contexts'])
         CONFIG_FILES[LOCAL_SETTINGS]['hook_contexts'].append(
-            context.SharedDBContext(
+            horizon_contexts.HorizonSharedDBContext(
                 user=config('database-user'),
                 database=config('database'),
                 ssl_dir=DASHBOARD_CONF_DIR))
@@ -216,6 +525,8 @@ def register_configs():
                          CONFIG_FILES[APACHE_24_CONF]['hook_contexts'])
         configs.register(APACHE_24_SSL,
                          CONFIG_FILES[APACHE_24_SSL]['hook_contexts'])
+        configs.register(MPM_EVENT_CONF,
+                         CONFIG_FILES[MPM_EVENT_CONF]['hook_contexts'])
     else:
         configs.register(APACHE_DEFAULT,
                          CONFIG_FILES[APACHE_DEFAULT]['hook_contexts'])
@@ -246,6 +557,8 @@ def restart_map():
             svcs.append(svc)
         if svcs:
             _map.append((f, svcs))
+    # written by HAProxySSLContext alongside haproxy.cfg
+    _map.append((horizon_contexts.HAPROXY_PEM, ['haproxy']))
     return OrderedDict(_map)
 
 
@@ -263,9 +576,160 @@ def enable_ssl():
     subprocess.call(['a2enmod', 'ssl'])
 
 
+def enable_mpm_event():
+    ''' Run apache2 with the event MPM when requested or needed by http2 '''
+    if not (config('apache-mpm-event') or horizon_contexts.http2_enabled()):
+        return
+    if cmp_pkgrevno('apache2', '2.4') < 0:
+        return
+    # NOTE: horizon runs in a mod_wsgi daemon, so nothing served by apache2
+    # itself needs prefork; mod_http2 also refuses to serve h2 under it.
+    subprocess.call(['a2dismod', 'mpm_prefork'])
+    subprocess.call(['a2dismod', 'mpm_worker'])
+    subprocess.call(['a2enmod', 'mpm_event'])
+
+
+def enable_http2():
+    ''' Enable mod_http2 when requested '''
+    if not horizon_contexts.http2_enabled():
+        subprocess.call(['a2dismod', 'http2'])
+        return
+    subprocess.call(['a2enmod', 'http2'])
+
+
+def enable_static_caching():
+    ''' Enable the modules used to cache and serve static assets '''
+    subprocess.call(['a2enmod', 'expires'])
+    subprocess.call(['a2enmod', 'headers'])
+    subprocess.call(['a2enmod', 'rewrite'])
+
+
+def _gzip(data):
+    buf = io.BytesIO()
+    gz = gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=9, mtime=0)
+    gz.write(data)
+    gz.close()
+    return buf.getvalue()
+
+
+def _precompressible(path):
+    return (path.endswith(PRECOMPRESS_EXTENSIONS) and
+            os.path.isfile(path) and
+            os.path.getsize(path) >= PRECOMPRESS_MIN_SIZE)
+
+
+def precompress_static(static_dir=STATIC_DIR):
+    """
+    Write compressed siblings of the text assets under static_dir so that
+    apache2 can serve them without compressing on each request.
+
+    A .gz file is written for each asset, plus a .br file when the brotli
+    module is available. Compressed files carry the modification time of
+    their source so they are only rewritten when the source changes, and
+    are removed once their source is gone.
+    """
+    encoders = {'.gz': _gzip}
+    if brotli:
+        encoders['.br'] = brotli.compress
+
+    for root, dirs, files in os.walk(static_dir, followlinks=True):
+        for f in files:
+            path = os.path.join(root, f)
+            ext = os.path.splitext(f)[1]
+            if ext in ('.gz', '.br'):
+                source = path[:-len(ext)]
+                if ext not in encoders or not _precompressible(source):
+                    os.remove(path)
+                continue
+            if not _precompressible(path):
+                continue
+
+            st = os.stat(path)
+            for ext, compress in encoders.iteritems():
+                target = path + ext
+                # whole seconds, as utime() does not keep full precision
+                if (os.path.exists(target) and
+                        int(os.stat(target).st_mtime) == int(st.st_mtime)):
+                    continue
+                with open(path, 'rb') as src:
+                    data = compress(src.read())
+                tmp = target + '.tmp'
+                with open(tmp, 'wb') as dst:
+                    dst.write(data)
+                os.chmod(tmp, st.st_mode & 0o777)
+                os.utime(tmp, (st.st_atime, st.st_mtime))
+                os.rename(tmp, target)
+
+
+def update_ocsp_response(max_age=OCSP_REFRESH_INTERVAL):
+    """
+    Fetch an OCSP response for the certificate served by haproxy, which
+    staples it to its TLS handshakes.
+
+    This is best effort: the certificate must name an OCSP responder and
+    its issuing CA must be configured; failures are logged and the
+    previous response, if any, is kept. A failed fetch is not retried for
+    OCSP_RETRY_INTERVAL unless the certificate changes.
+
+    :param max_age: refresh a stored response once older than this.
+    :return (bool): True if a new response was stored.
+    """
+    pem = horizon_contexts.HAPROXY_PEM
+    cert = horizon_contexts.SSL_CERT
+    issuer = horizon_contexts.CA_CERT_FILE
+    ocsp = pem + '.ocsp'
+    # runs on every update-status, so rule out the common cases before
+    # touching the package database or the certificates
+    if config('ssl-termination') != 'haproxy' or not os.path.exists(pem):
+        return False
+
+    db = kv()
+    last_attempt = db.get(OCSP_ATTEMPT_KEY) or 0
+    if (last_attempt >= os.path.getmtime(pem) and
+            time.time() - last_attempt < OCSP_RETRY_INTERVAL):
+        return False
+
+    if (os.path.exists(ocsp) and
+            os.path.getmtime(ocsp) >= os.path.getmtime(pem) and
+            time.time() - os.path.getmtime(ocsp) < max_age):
+        return False
+
+    if (horizon_contexts.get_ssl_termination() != 'haproxy' or
+            not os.path.exists(cert) or
+            not os.path.exists(issuer)):
+        return False
+
+    db.set(OCSP_ATTEMPT_KEY, time.time())
+    db.flush()
+
+    try:
+        url = subprocess.check_output(['openssl', 'x509', '-noout',
+                                       '-ocsp_uri', '-in', cert]).strip()
+        if not url:
+            log('Certificate names no OCSP responder, not stapling')
+            return False
+        subprocess.check_call(['openssl', 'ocsp', '-no_nonce',
+                               '-timeout', str(OCSP_TIMEOUT),
+                               '-issuer', issuer, '-cert', cert,
+                               '-url', url, '-respout', ocsp + '.tmp'])
+    except subprocess.CalledProcessError as e:
+        log('Unable to fetch OCSP response: %s' % e, level=WARNING)
+        return False
+
+    os.rename(ocsp + '.tmp', ocsp)
+    return True
+
+
+def setup_memcached_socket():
+    ''' Create the directory holding the local memcached unix socket '''
+    if horizon_contexts.get_memcached_socket():
+        mkdir(os.path.dirname(horizon_contexts.MEMCACHED_SOCKET),
+              owner='memcache', group='memcache', perms=0o755)
+
+
 def determine_packages():
     """Determine packages to install"""
-    packages = BASE_PACKAGES
+    packages = list(BASE_PACKAGES)
 
     if git_install_requested():
         packages.extend(BASE_GIT_PACKAGES)
@@ -278,6 +742,12 @@ def determine_packages():
     # Really should be handled as a dep in the openstack-dashboard package
     if release >= 'mitaka':
         packages.append('python-pymysql')
+    if horizon_contexts.get_cache_backend() == 'pylibmc':
+        if git_install_requested():
+            # pylibmc is built against libmemcached in the venv
+            packages.append('libmemcached-dev')
+        else:
+            packages.append('python-pylibmc')
     return list(set(packages))
 
 
@@ -415,18 +885,19 @@ def git_post_install(projects_yaml):
     os.chmod('/var/lib/openstack-dashboard', 0o750)
     os.chmod('/usr/share/openstack-dashboard/manage.py', 0o755),
 
+    cache_clients = ['python-memcached']
+    if horizon_contexts.get_cache_backend() == 'pylibmc':
+        cache_clients.append('pylibmc')
+
     http_proxy = git_yaml_value(projects_yaml, 'http_proxy')
-    if http_proxy:
-        pip_install('python-memcached', proxy=http_proxy,
-                    venv=git_pip_venv_dir(projects_yaml))
-    else:
-        pip_install('python-memcached',
-                    venv=git_pip_venv_dir(projects_yaml))
-    python = os.path.join(git_pip_venv_dir(projects_yaml), 'bin/python')
-    subprocess.check_call([python, '/usr/share/openstack-dashboard/manage.py',
-                           'collectstatic', '--noinput'])
-    subprocess.check_call([python, '/usr/share/openstack-dashboard/manage.py',
-                           'compress', '--force'])
+    for client in cache_clients:
+        if http_proxy:
+            pip_install(client, proxy=http_proxy,
+                        venv=git_pip_venv_dir(projects_yaml))
+        else:
+            pip_install(client,
+                        venv=git_pip_venv_dir(projects_yaml))
+    build_static(projects_yaml)
 
     uid = pwd.getpwnam('horizon').pw_uid
     gid = grp.getgrnam('horizon').gr_gid
@@ -446,8 +917,13 @@ def git_post_install(projects_yaml):
         service_restart('apache2')
 
 
-def git_post_install_late(projects_yaml):
-    """Perform horizon post-install setup."""
+def git_post_install_late(projects_yaml, force=False):
+    """Perform horizon post-install setup.
+
+    collectstatic and compress are skipped when their inputs are unchanged
+    since the last build, unless force is set, as the rebuild-static action
+    does.
+    """
     projects_yaml = git_default_repos(projects_yaml)
 
     subprocess.check_call(['a2enconf', 'openstack-dashboard'])
@@ -455,12 +931,63 @@ def git_post_install_late(projects_yaml):
     if not is_unit_paused_set():
         service_restart('apache2')
 
+    if (not force and
+            kv().get(STATIC_FINGERPRINT_KEY) ==
+            static_fingerprint(projects_yaml)):
+        log('Static assets are up to date, skipping collectstatic and '
+            'compress')
+        return
+
+    build_static(projects_yaml)
+
+
+def static_fingerprint(projects_yaml):
+    """
+    Returns a digest of the inputs to collectstatic and compress.
+
+    Covers the path, size and modification time of every file in the
+    dashboard source tree, the theme and the virtualenv holding horizon
+    and any installed plugins, plus the charm options rendered into
+    local_settings.py that change the compressed output.
+
+    :param projects_yaml: the openstack-origin-git projects yaml.
+    :return (string): hex digest of the manifest.
+    """
+    manifest = hashlib.sha256()
+    for key in STATIC_CONFIG_KEYS:
+        manifest.update('%s=%s\n' % (key, config(key)))
+
+    dirs = STATIC_SOURCE_DIRS + [git_pip_venv_dir(projects_yaml)]
+    for top in dirs:
+        for root, subdirs, files in os.walk(top):
+            if root == STATIC_DIR:
+                subdirs[:] = []
+                continue
+            subdirs.sort()
+            for f in sorted(files):
+                # skip bytecode and state written when manage.py runs
+                if f.startswith('.') or f.endswith(('.pyc', '.pyo')):
+                    continue
+                path = os.path.join(root, f)
+                st = os.lstat(path)
+                manifest.update('%s %d %d\n' %
+                                (path, st.st_size, int(st.st_mtime)))
+
+    return manifest.hexdigest()
+
+
+def build_static(projects_yaml):
+    """Run collectstatic and compress, recording the inputs used."""
     python = os.path.join(git_pip_venv_dir(projects_yaml), 'bin/python')
     subprocess.check_call([python, '/usr/share/openstack-dashboard/manage.py',
                            'collectstatic', '--noinput'])
     subprocess.check_call([python, '/usr/share/openstack-dashboard/manage.py',
                            'compress', '--force'])
 
+    db = kv()
+    db.set(STATIC_FINGERPRINT_KEY, static_fingerprint(projects_yaml))
+    db.flush()
+
 
 # [thedac] Work around apache restart Bug#1552822
 # Allow for sleep time between stop and start
@@ -483,6 +1010,9 @@ def restart_on_change(restart_map, stopstart=False, sleep=0):
     or removed. Standard wildcards are supported, see documentation
     for the 'glob' module for more information.
 
+    Config files rendered from CONFIG_FILES are not hashed: the renderer
+    reports the ones it changed through CHANGED_FILES.
+
     param: sleep    Allow for sleep time between stop and start
                     Only used when stopstart=True
     """
@@ -490,11 +1020,17 @@ def restart_on_change(restart_map, stopstart=False, sleep=0):
         def wrapped_f(*args, **kwargs):
             if is_unit_paused_set():
                 return f(*args, **kwargs)
-            checksums = {path: path_hash(path) for path in restart_map}
+            checksums = {path: path_hash(path) for path in restart_map
+                         if path not in CONFIG_FILES}
+            written = len(CHANGED_FILES)
             f(*args, **kwargs)
+            changed = set(CHANGED_FILES[written:])
             restarts = []
             for path in restart_map:
-                if path_hash(path) != checksums[path]:
+                if path in CONFIG_FILES:
+                    if path in changed:
+                        restarts += restart_map[path]
+                elif path_hash(path) != checksums[path]:
                     restarts += restart_map[path]
             services_list = list(OrderedDict.fromkeys(restarts))
             if not stopstart:
@@ -540,9 +1076,30 @@ def assess_status_func(configs):
     """
     return make_assess_status_func(
         configs, REQUIRED_INTERFACES,
+        charm_func=check_optional_relations,
         services=services(), ports=None)
 
 
+def check_optional_relations(configs):
+    """Check relations that are only required by some option values.
+
+    The 'db' and 'cached_db' session engines store sessions in the shared-db
+    database; until it is available the release's implicit session engine
+    is rendered instead.
+    @param configs: a templating.OSConfigRenderer() object
+    @returns (state, message) for the workload status
+    """
+    engine = config('session-engine')
+    if engine in horizon_contexts.DB_SESSION_ENGINES:
+        if not relation_ids('shared-db'):
+            return ('blocked',
+                    'session-engine {} requires the shared-db relation'
+                    .format(engine))
+        if 'shared-db' not in configs.complete_contexts():
+            return ('waiting', 'Incomplete relations: shared-db')
+    return ('unknown', '')
+
+
 def pause_unit_helper(configs):
     """Helper function to pause a unit, and then call assess_status(...) in
     effect, so that the status is correctly updated.
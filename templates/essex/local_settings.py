@@ -26,7 +26,19 @@ SECRET_KEY = 'elj1IWiLoWHgcyYxFVLj7cM5rGOOxWl0'
 
 LOCAL_PATH = os.path.dirname(os.path.abspath(__file__))
 
-CACHE_BACKEND = 'memcached://127.0.0.1:11211/'
+CACHES = {
+    'default': {
+        'BACKEND' : '{{ cache_backend }}',
+        'LOCATION' : '{{ cache_servers|join(";") }}',
+{%- if cache_options %}
+        'OPTIONS' : {
+{%- for key, value in cache_options|dictsort %}
+            '{{ key }}' : {{ value }},
+{%- endfor %}
+        },
+{%- endif %}
+    }
+}
 
 # Send email to the console by default
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
@@ -67,7 +79,7 @@ OPENSTACK_KEYSTONE_BACKEND = {
 
 # The number of Swift containers and objects to display on a single page before
 # providing a paging element (a "more" link) to paginate results.
-API_RESULT_LIMIT = 1000
+API_RESULT_LIMIT = {{ api_result_limit or 1000 }}
 
 # If you have external monitoring links, eg:
 # EXTERNAL_MONITORING = [
@@ -37,8 +37,27 @@ LOCAL_PATH = os.path.dirname(os.path.abspath(__file__))
 
 # We recommend you use memcached for development; otherwise after every reload
 # of the django development server, you will have to login again. To use
-# memcached set CACHE_BACKED to something like 'memcached://127.0.0.1:11211/'
-CACHE_BACKEND = 'memcached://127.0.0.1:11211'
+# memcached set CACHES to something like
+# CACHES = {
+#    'default': {
+#        'BACKEND' : 'django.core.cache.backends.memcached.MemcachedCache',
+#        'LOCATION' : '127.0.0.1:11211',
+#    }
+#}
+
+CACHES = {
+    'default': {
+        'BACKEND' : '{{ cache_backend }}',
+        'LOCATION' : '{{ cache_servers|join(";") }}',
+{%- if cache_options %}
+        'OPTIONS' : {
+{%- for key, value in cache_options|dictsort %}
+            '{{ key }}' : {{ value }},
+{%- endfor %}
+        },
+{%- endif %}
+    }
+}
 
 # Send email to the console by default
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
@@ -87,8 +106,8 @@ OPENSTACK_HYPERVISOR_FEATURES = {
 # The number of objects (Swift containers/objects or images) to display
 # on a single page before providing a paging element (a "more" link)
 # to paginate results.
-API_RESULT_LIMIT = 1000
-API_RESULT_PAGE_SIZE = 20
+API_RESULT_LIMIT = {{ api_result_limit or 1000 }}
+API_RESULT_PAGE_SIZE = {{ api_result_page_size or 20 }}
 
 # The timezone of the server. This should correspond with the timezone
 # of your entire OpenStack installation, and hopefully be in UTC.
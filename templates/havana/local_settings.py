@@ -93,14 +93,25 @@ LOCAL_PATH = os.path.dirname(os.path.abspath(__file__))
 # for all of them.
 
 SECRET_KEY = "{{ secret }}"
+{%- if secure_proxy_ssl_header %}
+# TLS terminates in haproxy, which passes the original scheme on
+SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
+{%- endif %}
 
 # We recommend you use memcached for development; otherwise after every reload
 # of the django development server, you will have to login again. To use
 # memcached set CACHES to something like
 CACHES = {
    'default': {
-       'BACKEND' : 'django.core.cache.backends.memcached.MemcachedCache',
-       'LOCATION' : '127.0.0.1:11211',
+      'BACKEND' : '{{ cache_backend }}',
+      'LOCATION' : '{{ cache_servers|join(";") }}',
+{%- if cache_options %}
+      'OPTIONS' : {
+{%- for key, value in cache_options|dictsort %}
+         '{{ key }}' : {{ value }},
+{%- endfor %}
+      },
+{%- endif %}
    }
 }
 
@@ -203,8 +214,8 @@ OPENSTACK_IMAGE_BACKEND = {
 # The number of objects (Swift containers/objects or images) to display
 # on a single page before providing a paging element (a "more" link)
 # to paginate results.
-API_RESULT_LIMIT = 1000
-API_RESULT_PAGE_SIZE = 20
+API_RESULT_LIMIT = {{ api_result_limit or 1000 }}
+API_RESULT_PAGE_SIZE = {{ api_result_page_size or 20 }}
 
 # The timezone of the server. This should correspond with the timezone
 # of your entire OpenStack installation, and hopefully be in UTC.
@@ -107,14 +107,25 @@ LOCAL_PATH = os.path.dirname(os.path.abspath(__file__))
 # SECRET_KEY for all of them.
 # SECRET_KEY = secret_key.generate_or_read_from_file('/var/lib/openstack-dashboard/secret_key')
 SECRET_KEY = "{{ secret }}"
+{%- if secure_proxy_ssl_header %}
+# TLS terminates in haproxy, which passes the original scheme on
+SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
+{%- endif %}
 
 # We recommend you use memcached for development; otherwise after every reload
 # of the django development server, you will have to login again. To use
 # memcached set CACHES to something like
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
-        'LOCATION': '127.0.0.1:11211',
+        'BACKEND': '{{ cache_backend }}',
+        'LOCATION': '{{ cache_servers|join(";") }}',
+{%- if cache_options %}
+        'OPTIONS': {
+{%- for key, value in cache_options|dictsort %}
+            '{{ key }}': {{ value }},
+{%- endfor %}
+        },
+{%- endif %}
     }
 }
 
@@ -290,6 +301,11 @@ OPENSTACK_NEUTRON_NETWORK = {
 #        ('vmdk', _('VMDK - Virtual Machine Disk')),
 #    ]
 #}
+{%- if image_upload_mode == 'off' %}
+
+# Disable image uploads through the dashboard
+HORIZON_IMAGES_ALLOW_UPLOAD = False
+{%- endif %}
 
 # The IMAGE_CUSTOM_PROPERTY_TITLES settings is used to customize the titles for
 # image custom property attributes that appear on image detail pages.
@@ -328,14 +344,23 @@ SECONDARY_ENDPOINT_TYPE = "{{ secondary_endpoint }}"
 # The number of objects (Swift containers/objects or images) to display
 # on a single page before providing a paging element (a "more" link)
 # to paginate results.
-API_RESULT_LIMIT = 1000
-API_RESULT_PAGE_SIZE = 20
+API_RESULT_LIMIT = {{ api_result_limit or 1000 }}
+API_RESULT_PAGE_SIZE = {{ api_result_page_size or 20 }}
 
 # The size of chunk in bytes for downloading objects from Swift
-SWIFT_FILE_TRANSFER_CHUNK_SIZE = 512 * 1024
+SWIFT_FILE_TRANSFER_CHUNK_SIZE = {{ swift_chunk_size or 512 * 1024 }}
+{%- if file_upload_max_memory_size %}
+
+# Spool uploads larger than a Swift chunk to disk rather than holding them
+# in the WSGI process
+FILE_UPLOAD_MAX_MEMORY_SIZE = {{ file_upload_max_memory_size }}
+{%- endif %}
+{%- if file_upload_temp_dir %}
+FILE_UPLOAD_TEMP_DIR = '{{ file_upload_temp_dir }}'
+{%- endif %}
 
 # Specify a maximum number of items to display in a dropdown.
-DROPDOWN_MAX_ITEMS = 30
+DROPDOWN_MAX_ITEMS = {{ dropdown_max_items or 30 }}
 
 # The timezone of the server. This should correspond with the timezone
 # of your entire OpenStack installation, and hopefully be in UTC.
@@ -128,6 +128,10 @@ LOCAL_PATH = os.path.dirname(os.path.abspath(__file__))
 # gets all requests routed to the same dashboard instance or you set the same
 # SECRET_KEY for all of them.
 SECRET_KEY = "{{ secret }}"
+{%- if secure_proxy_ssl_header %}
+# TLS terminates in haproxy, which passes the original scheme on
+SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
+{%- endif %}
 
 # We recommend you use memcached for development; otherwise after every reload
 # of the django development server, you will have to login again. To use
@@ -135,12 +139,19 @@ SECRET_KEY = "{{ secret }}"
 
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
-        'LOCATION': '127.0.0.1:11211',
+        'BACKEND': '{{ cache_backend }}',
+        'LOCATION': '{{ cache_servers|join(";") }}',
+{%- if cache_options %}
+        'OPTIONS': {
+{%- for key, value in cache_options|dictsort %}
+            '{{ key }}': {{ value }},
+{%- endfor %}
+        },
+{%- endif %}
     },
 }
 {% if database_host -%}
-SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+SESSION_ENGINE = 'django.contrib.sessions.backends.{{ session_engine or 'cached_db' }}'
 DATABASES = {
     'default': {
         # Database configuration here
@@ -149,11 +160,17 @@ DATABASES = {
         'USER': '{{ database_user }}',
         'PASSWORD': '{{ database_password }}',
         'HOST': '{{ database_host }}',
+{%- if database_conn_max_age %}
+        # Up to {{ database_max_connections }} connections per unit are kept open
+        'CONN_MAX_AGE': {{ database_conn_max_age }},
+{%- endif %}
         'default-character-set': 'utf8'
     }
 }
 {% else -%}
-{% if api_version == "3" -%}
+{% if session_engine in ['signed_cookies', 'cache'] -%}
+SESSION_ENGINE = 'django.contrib.sessions.backends.{{ session_engine }}'
+{% elif api_version == "3" -%}
 # Warning: Please add DB relation for Keystone v3 + HA deployments
 SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
 {% endif -%}
@@ -420,6 +437,11 @@ IMAGE_RESERVED_CUSTOM_PROPERTIES = []
 # image form. If set to 'off', there will be no file form field on the create
 # image form. See documentation for deployment considerations.
 #HORIZON_IMAGES_UPLOAD_MODE = 'legacy'
+{%- if image_upload_mode %}
+# 'direct' keeps uploads off the dashboard's WSGI threads; the Image service
+# must then allow the dashboard's origin in its [cors] section.
+HORIZON_IMAGES_UPLOAD_MODE = '{{ image_upload_mode }}'
+{%- endif %}
 
 # OPENSTACK_ENDPOINT_TYPE specifies the endpoint type to use for the endpoints
 # in the Keystone service catalog. Use this setting when Horizon is running
@@ -442,14 +464,28 @@ SECONDARY_ENDPOINT_TYPE = "{{ secondary_endpoint }}"
 # The number of objects (Swift containers/objects or images) to display
 # on a single page before providing a paging element (a "more" link)
 # to paginate results.
-API_RESULT_LIMIT = 1000
-API_RESULT_PAGE_SIZE = 20
+API_RESULT_LIMIT = {{ api_result_limit or 1000 }}
+API_RESULT_PAGE_SIZE = {{ api_result_page_size or 20 }}
 
 # The size of chunk in bytes for downloading objects from Swift
-SWIFT_FILE_TRANSFER_CHUNK_SIZE = 512 * 1024
+SWIFT_FILE_TRANSFER_CHUNK_SIZE = {{ swift_chunk_size or 512 * 1024 }}
+{%- if file_upload_max_memory_size %}
+
+# Spool uploads larger than a Swift chunk to disk rather than holding them
+# in the WSGI process
+FILE_UPLOAD_MAX_MEMORY_SIZE = {{ file_upload_max_memory_size }}
+{%- endif %}
+{%- if file_upload_temp_dir %}
+FILE_UPLOAD_TEMP_DIR = '{{ file_upload_temp_dir }}'
+{%- endif %}
 
 # Specify a maximum number of items to display in a dropdown.
-DROPDOWN_MAX_ITEMS = 30
+DROPDOWN_MAX_ITEMS = {{ dropdown_max_items or 30 }}
+
+# Fetch the IP addresses of every instance from neutron when listing
+# instances. Disabling it saves a port listing per page, at the cost of
+# addresses not being refreshed until nova's own cache is.
+OPENSTACK_INSTANCE_RETRIEVE_IP_ADDRESSES = {{ instance_retrieve_ip_addresses }}
 
 # The timezone of the server. This should correspond with the timezone
 # of your entire OpenStack installation, and hopefully be in UTC.
@@ -528,6 +564,80 @@ POLICY_FILES = {
 #    ('material', 'Material', 'themes/material'),
 #]
 
+{%- if log_queue %}
+
+import atexit
+import copy
+import logging
+import threading
+
+from six.moves import queue as _queue
+
+
+class _QueueHandler(logging.Handler):
+    """
+    Hands log records to a listener thread that passes them on to the target
+    handler, so requests never wait on log I/O. Records are dropped rather
+    than block a request when the queue is full.
+
+    All instances share one queue and listener thread, which is drained when
+    the process exits. The target formats the records, with the formatter
+    configured for this handler.
+    """
+
+    queue = _queue.Queue(10000)
+    listener = None
+    lock = threading.Lock()
+
+    def __init__(self, target):
+        logging.Handler.__init__(self)
+        self.target = target
+        with _QueueHandler.lock:
+            if _QueueHandler.listener is None:
+                listener = threading.Thread(target=_QueueHandler._listen,
+                                            name='log-listener')
+                listener.daemon = True
+                listener.start()
+                atexit.register(_QueueHandler._flush)
+                _QueueHandler.listener = listener
+
+    def setFormatter(self, fmt):
+        self.target.setFormatter(fmt)
+
+    def emit(self, record):
+        try:
+            # Merge the arguments now, while they are still current, into a
+            # copy as other handlers may still see this record
+            record = copy.copy(record)
+            record.msg = record.getMessage()
+            record.args = None
+            self.queue.put_nowait((self.target, record))
+        except _queue.Full:
+            pass
+        except Exception:
+            self.handleError(record)
+
+    @staticmethod
+    def _listen():
+        while True:
+            item = _QueueHandler.queue.get()
+            if item is None:
+                return
+            target, record = item
+            try:
+                target.handle(record)
+            except Exception:
+                target.handleError(record)
+
+    @staticmethod
+    def _flush(timeout=5):
+        try:
+            _QueueHandler.queue.put(None, timeout=timeout)
+        except _queue.Full:
+            return
+        _QueueHandler.listener.join(timeout)
+{%- endif %}
+
 LOGGING = {
     'version': 1,
     # When set to True this will disable all logging except
@@ -550,12 +660,31 @@ LOGGING = {
         'console': {
             # Set the level to "DEBUG" for verbose output logging.
             'level': 'INFO',
+            {%- if log_queue %}
+            '()': _QueueHandler,
+            'target': logging.StreamHandler(),
+            {%- else %}
             'class': 'logging.StreamHandler',
+            {%- endif %}
         },
         {% if use_syslog %}
+        'syslog': {
+            'level': 'INFO',
+            {%- if log_queue %}
+            '()': _QueueHandler,
+            'target': SysLogHandler(),
+            {%- else %}
+            'class': 'logging.handlers.SysLogHandler',
+            {%- endif %}
+        },
         'operation': {
             'level': 'INFO',
+            {%- if log_queue %}
+            '()': _QueueHandler,
+            'target': SysLogHandler(),
+            {%- else %}
             'class': 'logging.handlers.SysLogHandler',
+            {%- endif %}
             'formatter': 'operation',
         },
         {% endif %}
@@ -698,6 +827,26 @@ LOGGING = {
         },
     },
 }
+{%- if log_levels %}
+
+# Levels set through the charm's log-levels option. Handlers pass everything
+# on and other loggers are capped at INFO, so only the named loggers get
+# more verbose.
+for _handler in LOGGING['handlers'].values():
+    _handler['level'] = 'DEBUG'
+for _logger in LOGGING['loggers'].values():
+    if _logger.get('level') == 'DEBUG':
+        _logger['level'] = 'INFO'
+for _name, _level in [
+{%- for name, level in log_levels %}
+    ('{{ name }}', '{{ level }}'),
+{%- endfor %}
+]:
+    LOGGING['loggers'].setdefault(_name, {
+        'handlers': [{% if use_syslog %}'syslog'{% else %}'console'{% endif %}],
+        'propagate': False,
+    })['level'] = _level
+{%- endif %}
 
 # 'direction' should not be specified for all_tcp/udp/icmp.
 # It is specified in the form.
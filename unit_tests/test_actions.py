@@ -44,6 +44,29 @@ class ResumeTestCase(CharmTestCase):
         self.resume_unit_helper.assert_called_once_with('test-config')
 
 
+class RebuildStaticTestCase(CharmTestCase):
+
+    def setUp(self):
+        super(RebuildStaticTestCase, self).setUp(
+            actions, ["git_install_requested", "git_post_install_late",
+                      "config", "action_fail"])
+        self.config.side_effect = self.test_config.get
+
+    def test_rebuild_static(self):
+        self.git_install_requested.return_value = True
+        self.test_config.set('openstack-origin-git', 'projects')
+        actions.rebuild_static([])
+        self.git_post_install_late.assert_called_once_with('projects',
+                                                           force=True)
+        self.assertFalse(self.action_fail.called)
+
+    def test_rebuild_static_not_git(self):
+        self.git_install_requested.return_value = False
+        actions.rebuild_static([])
+        self.assertFalse(self.git_post_install_late.called)
+        self.assertTrue(self.action_fail.called)
+
+
 class MainTestCase(CharmTestCase):
 
     def setUp(self):
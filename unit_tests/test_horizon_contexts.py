@@ -12,8 +12,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from mock import MagicMock, patch, call
+from mock import MagicMock, PropertyMock, patch, call
 import horizon_contexts
+import os
 from contextlib import contextmanager
 
 from test_utils import (
@@ -32,7 +33,9 @@ TO_PATCH = [
     'local_unit',
     'unit_get',
     'pwgen',
-    'get_host_ip'
+    'get_host_ip',
+    'get_total_ram',
+    'cmp_pkgrevno',
 ]
 
 
@@ -60,17 +63,39 @@ class TestHorizonContexts(CharmTestCase):
         super(TestHorizonContexts, self).setUp(horizon_contexts, TO_PATCH)
         self.config.side_effect = self.test_config.get
         self.pwgen.return_value = "secret"
+        self.get_total_ram.return_value = 4 * 1024 ** 3
 
     def test_Apachecontext(self):
         self.assertEquals(horizon_contexts.ApacheContext()(),
-                          {'http_port': 70, 'https_port': 433})
+                          {'http_port': 70, 'https_port': 433,
+                           'http2': False})
 
     def test_Apachecontext_enforce_ssl(self):
         self.test_config.set('enforce-ssl', True)
         self.get_host_ip.return_value = '10.0.0.1'
         self.assertEqual(horizon_contexts.ApacheContext()(),
                          {'http_port': 70, 'https_port': 433,
-                          'ssl_addr': '10.0.0.1'})
+                          'http2': False, 'ssl_addr': '10.0.0.1'})
+
+    def test_Apachecontext_enforce_ssl_haproxy(self):
+        self.test_config.set('enforce-ssl', True)
+        self.test_config.set('ssl-termination', 'haproxy')
+        self.cmp_pkgrevno.return_value = 1
+        self.assertEqual(horizon_contexts.ApacheContext()(),
+                         {'http_port': 70, 'https_port': 433,
+                          'http2': False})
+
+    def test_Apachecontext_http2(self):
+        self.test_config.set('http2', True)
+        self.cmp_pkgrevno.return_value = 1
+        self.assertTrue(horizon_contexts.ApacheContext()()['http2'])
+        self.cmp_pkgrevno.assert_called_with('apache2', '2.4.17')
+
+    def test_Apachecontext_http2_old_apache(self):
+        self.test_config.set('http2', True)
+        self.cmp_pkgrevno.return_value = -1
+        self.assertFalse(horizon_contexts.ApacheContext()()['http2'])
+        self.assertTrue(self.log.called)
 
     @patch.object(horizon_contexts, 'get_ca_cert', lambda: None)
     @patch('os.chmod')
@@ -106,6 +131,18 @@ class TestHorizonContexts(CharmTestCase):
                            'ubuntu_theme': True,
                            'default_theme': None,
                            'virtualenv': None,
+                           'session_engine': None,
+                           'secure_proxy_ssl_header': False,
+                           'api_result_limit': None,
+                           'api_result_page_size': None,
+                           'dropdown_max_items': None,
+                           'instance_retrieve_ip_addresses': True,
+                           'image_upload_mode': None,
+                           'swift_chunk_size': None,
+                           'file_upload_max_memory_size': None,
+                           'file_upload_temp_dir': None,
+                           'log_queue': False,
+                           'log_levels': [],
                            'secret': 'secret',
                            'support_profile': None,
                            "neutron_network_dvr": False,
@@ -123,6 +160,18 @@ class TestHorizonContexts(CharmTestCase):
                            'ubuntu_theme': True,
                            'default_theme': None,
                            'virtualenv': None,
+                           'session_engine': None,
+                           'secure_proxy_ssl_header': False,
+                           'api_result_limit': None,
+                           'api_result_page_size': None,
+                           'dropdown_max_items': None,
+                           'instance_retrieve_ip_addresses': True,
+                           'image_upload_mode': None,
+                           'swift_chunk_size': None,
+                           'file_upload_max_memory_size': None,
+                           'file_upload_temp_dir': None,
+                           'log_queue': False,
+                           'log_levels': [],
                            'secret': 'secret',
                            'support_profile': None,
                            "neutron_network_dvr": False,
@@ -140,6 +189,18 @@ class TestHorizonContexts(CharmTestCase):
                            'ubuntu_theme': False,
                            'default_theme': None,
                            'virtualenv': None,
+                           'session_engine': None,
+                           'secure_proxy_ssl_header': False,
+                           'api_result_limit': None,
+                           'api_result_page_size': None,
+                           'dropdown_max_items': None,
+                           'instance_retrieve_ip_addresses': True,
+                           'image_upload_mode': None,
+                           'swift_chunk_size': None,
+                           'file_upload_max_memory_size': None,
+                           'file_upload_temp_dir': None,
+                           'log_queue': False,
+                           'log_levels': [],
                            'secret': 'secret',
                            'support_profile': None,
                            "neutron_network_dvr": False,
@@ -158,6 +219,18 @@ class TestHorizonContexts(CharmTestCase):
                            'ubuntu_theme': False,
                            'default_theme': 'material',
                            'virtualenv': None,
+                           'session_engine': None,
+                           'secure_proxy_ssl_header': False,
+                           'api_result_limit': None,
+                           'api_result_page_size': None,
+                           'dropdown_max_items': None,
+                           'instance_retrieve_ip_addresses': True,
+                           'image_upload_mode': None,
+                           'swift_chunk_size': None,
+                           'file_upload_max_memory_size': None,
+                           'file_upload_temp_dir': None,
+                           'log_queue': False,
+                           'log_levels': [],
                            'secret': 'secret',
                            'support_profile': None,
                            "neutron_network_dvr": False,
@@ -175,6 +248,18 @@ class TestHorizonContexts(CharmTestCase):
                            'ubuntu_theme': True,
                            'default_theme': None,
                            'virtualenv': None,
+                           'session_engine': None,
+                           'secure_proxy_ssl_header': False,
+                           'api_result_limit': None,
+                           'api_result_page_size': None,
+                           'dropdown_max_items': None,
+                           'instance_retrieve_ip_addresses': True,
+                           'image_upload_mode': None,
+                           'swift_chunk_size': None,
+                           'file_upload_max_memory_size': None,
+                           'file_upload_temp_dir': None,
+                           'log_queue': False,
+                           'log_levels': [],
                            'secret': 'secret',
                            'support_profile': None,
                            "neutron_network_dvr": False,
@@ -192,6 +277,18 @@ class TestHorizonContexts(CharmTestCase):
                            'ubuntu_theme': True,
                            'default_theme': None,
                            'virtualenv': None,
+                           'session_engine': None,
+                           'secure_proxy_ssl_header': False,
+                           'api_result_limit': None,
+                           'api_result_page_size': None,
+                           'dropdown_max_items': None,
+                           'instance_retrieve_ip_addresses': True,
+                           'image_upload_mode': None,
+                           'swift_chunk_size': None,
+                           'file_upload_max_memory_size': None,
+                           'file_upload_temp_dir': None,
+                           'log_queue': False,
+                           'log_levels': [],
                            'secret': 'secret',
                            'support_profile': None,
                            "neutron_network_dvr": False,
@@ -209,6 +306,18 @@ class TestHorizonContexts(CharmTestCase):
                            'ubuntu_theme': True,
                            'default_theme': None,
                            'virtualenv': None,
+                           'session_engine': None,
+                           'secure_proxy_ssl_header': False,
+                           'api_result_limit': None,
+                           'api_result_page_size': None,
+                           'dropdown_max_items': None,
+                           'instance_retrieve_ip_addresses': True,
+                           'image_upload_mode': None,
+                           'swift_chunk_size': None,
+                           'file_upload_max_memory_size': None,
+                           'file_upload_temp_dir': None,
+                           'log_queue': False,
+                           'log_levels': [],
                            'secret': 'secret',
                            'support_profile': None,
                            "neutron_network_dvr": False,
@@ -231,6 +340,18 @@ class TestHorizonContexts(CharmTestCase):
                            'ubuntu_theme': True,
                            'default_theme': None,
                            'virtualenv': None,
+                           'session_engine': None,
+                           'secure_proxy_ssl_header': False,
+                           'api_result_limit': None,
+                           'api_result_page_size': None,
+                           'dropdown_max_items': None,
+                           'instance_retrieve_ip_addresses': True,
+                           'image_upload_mode': None,
+                           'swift_chunk_size': None,
+                           'file_upload_max_memory_size': None,
+                           'file_upload_temp_dir': None,
+                           'log_queue': False,
+                           'log_levels': [],
                            'secret': 'secret',
                            'support_profile': None,
                            "neutron_network_dvr": True,
@@ -240,6 +361,85 @@ class TestHorizonContexts(CharmTestCase):
                            "neutron_network_vpn": True,
                            "cinder_backup": True})
 
+    def test_HorizonContext_pagination(self):
+        self.test_config.set('api-result-limit', 200)
+        self.test_config.set('api-result-page-size', 50)
+        self.test_config.set('dropdown-max-items', 100)
+        self.test_config.set('instance-retrieve-ip-addresses', False)
+        ctxt = horizon_contexts.HorizonContext()()
+        self.assertEquals(ctxt['api_result_limit'], 200)
+        self.assertEquals(ctxt['api_result_page_size'], 50)
+        self.assertEquals(ctxt['dropdown_max_items'], 100)
+        self.assertFalse(ctxt['instance_retrieve_ip_addresses'])
+
+    def test_HorizonContext_image_upload_mode(self):
+        self.test_config.set('image-upload-mode', 'direct')
+        self.assertEquals(
+            horizon_contexts.HorizonContext()()['image_upload_mode'],
+            'direct')
+
+    def test_HorizonContext_invalid_image_upload_mode(self):
+        self.test_config.set('image-upload-mode', 'ftp')
+        self.assertRaises(Exception, horizon_contexts.HorizonContext())
+        self.assertTrue(self.log.called)
+
+    def test_get_swift_chunk_size(self):
+        self.assertEquals(horizon_contexts.get_swift_chunk_size(), None)
+        self.test_config.set('swift-chunk-size', 4096)
+        self.assertEquals(horizon_contexts.get_swift_chunk_size(),
+                          4 * 1024 * 1024)
+
+    def test_get_file_upload_max_memory_size(self):
+        self.assertEquals(
+            horizon_contexts.get_file_upload_max_memory_size(), None)
+        # never below Django's default
+        self.test_config.set('swift-chunk-size', 1024)
+        self.assertEquals(
+            horizon_contexts.get_file_upload_max_memory_size(), None)
+        self.test_config.set('swift-chunk-size', 4096)
+        self.assertEquals(
+            horizon_contexts.get_file_upload_max_memory_size(),
+            4 * 1024 * 1024)
+
+    def test_HorizonContext_log_levels(self):
+        self.test_config.set('log-queue', True)
+        self.test_config.set('log-levels',
+                             'novaclient=debug, keystoneclient=INFO')
+        ctxt = horizon_contexts.HorizonContext()()
+        self.assertTrue(ctxt['log_queue'])
+        self.assertEquals(ctxt['log_levels'],
+                          [('keystoneclient', 'INFO'),
+                           ('novaclient', 'DEBUG')])
+
+    def test_HorizonContext_invalid_log_levels(self):
+        self.test_config.set('log-levels', 'novaclient=LOUD')
+        self.assertRaises(Exception, horizon_contexts.HorizonContext())
+        self.assertTrue(self.log.called)
+
+    def test_HorizonContext_signed_cookies(self):
+        self.test_config.set('session-engine', 'signed_cookies')
+        ctxt = horizon_contexts.HorizonContext()()
+        self.assertEqual(ctxt['session_engine'], 'signed_cookies')
+
+    def test_HorizonContext_cached_db(self):
+        self.test_config.set('session-engine', 'cached_db')
+        self.relation_ids.return_value = ['shared-db:0']
+        ctxt = horizon_contexts.HorizonContext()()
+        self.assertEqual(ctxt['session_engine'], 'cached_db')
+        self.assertFalse(self.log.called)
+
+    def test_HorizonContext_db_not_related(self):
+        self.test_config.set('session-engine', 'db')
+        self.relation_ids.return_value = []
+        ctxt = horizon_contexts.HorizonContext()()
+        self.assertEqual(ctxt['session_engine'], 'db')
+        self.assertTrue(self.log.called)
+
+    def test_HorizonContext_invalid_session_engine(self):
+        self.test_config.set('session-engine', 'file')
+        self.assertRaises(Exception, horizon_contexts.HorizonContext())
+        self.assertTrue(self.log.called)
+
     def test_IdentityServiceContext_not_related(self):
         self.relation_ids.return_value = []
         self.context_complete.return_value = False
@@ -358,12 +558,22 @@ class TestHorizonContexts(CharmTestCase):
         self.relation_ids.return_value = []
         self.local_unit.return_value = 'openstack-dashboard/0'
         self.unit_get.return_value = "10.5.0.1"
+        self.cmp_pkgrevno.return_value = 1
         with patch_open() as (_open, _file):
             self.assertEquals(horizon_contexts.HorizonHAProxyContext()(),
                               {'units': {'openstack-dashboard-0': '10.5.0.1'},
                                'service_ports': {'dash_insecure': [80, 70],
                                                  'dash_secure': [443, 433]},
-                               'prefer_ipv6': False})
+                               'prefer_ipv6': False,
+                               'http_services': [],
+                               'health_check_path': '/horizon/auth/login/',
+                               'server_options': {
+                                   'dash_insecure':
+                                   'check inter 5000 rise 2 fall 3 '
+                                   'slowstart 30000',
+                                   'dash_secure':
+                                   'check inter 5000 rise 2 fall 3 '
+                                   'slowstart 30000 check-ssl verify none'}})
             _open.assert_called_with('/etc/default/haproxy', 'w')
             self.assertTrue(_file.write.called)
 
@@ -375,6 +585,7 @@ class TestHorizonContexts(CharmTestCase):
         self.relation_get.side_effect = ['10.5.0.2', '10.5.0.3']
         self.local_unit.return_value = 'openstack-dashboard/0'
         self.unit_get.return_value = "10.5.0.1"
+        self.cmp_pkgrevno.return_value = 1
         with patch_open() as (_open, _file):
             self.assertEquals(horizon_contexts.HorizonHAProxyContext()(),
                               {'units': {'openstack-dashboard-0': '10.5.0.1',
@@ -382,10 +593,437 @@ class TestHorizonContexts(CharmTestCase):
                                          'openstack-dashboard-2': '10.5.0.3'},
                                'service_ports': {'dash_insecure': [80, 70],
                                                  'dash_secure': [443, 433]},
-                               'prefer_ipv6': False})
+                               'prefer_ipv6': False,
+                               'http_services': [],
+                               'health_check_path': '/horizon/auth/login/',
+                               'server_options': {
+                                   'dash_insecure':
+                                   'check inter 5000 rise 2 fall 3 '
+                                   'slowstart 30000',
+                                   'dash_secure':
+                                   'check inter 5000 rise 2 fall 3 '
+                                   'slowstart 30000 check-ssl verify none'}})
             _open.assert_called_with('/etc/default/haproxy', 'w')
             self.assertTrue(_file.write.called)
 
+    def test_ApacheStaticContext(self):
+        self.assertEqual(horizon_contexts.ApacheStaticContext()(),
+                         {'static_max_age': 3600,
+                          'static_immutable_max_age': 31536000,
+                          'static_precompression': False})
+
+    def test_ApacheStaticContext_disabled(self):
+        self.test_config.set('static-cache-max-age', 0)
+        self.assertEqual(horizon_contexts.ApacheStaticContext()(),
+                         {'static_max_age': 0,
+                          'static_immutable_max_age': 31536000,
+                          'static_precompression': False})
+
+    def test_HorizonHAProxyContext_tcp_check(self):
+        self.test_config.set('haproxy-http-check', False)
+        self.relation_ids.return_value = []
+        self.local_unit.return_value = 'openstack-dashboard/0'
+        self.unit_get.return_value = "10.5.0.1"
+        with patch_open():
+            ctxt = horizon_contexts.HorizonHAProxyContext()()
+        self.assertFalse('health_check_path' in ctxt)
+        self.assertEquals(ctxt['server_options'],
+                          {'dash_insecure': 'check', 'dash_secure': 'check'})
+
+    def test_HorizonHAProxyContext_http_check_old_haproxy(self):
+        self.test_config.set('webroot', '/')
+        self.test_config.set('haproxy-slowstart', 0)
+        self.relation_ids.return_value = []
+        self.local_unit.return_value = 'openstack-dashboard/0'
+        self.unit_get.return_value = "10.5.0.1"
+        self.cmp_pkgrevno.return_value = -1
+        with patch_open():
+            ctxt = horizon_contexts.HorizonHAProxyContext()()
+        self.assertEquals(ctxt['health_check_path'], '/auth/login/')
+        self.assertEquals(ctxt['server_options'],
+                          {'dash_insecure': 'check inter 5000 rise 2 fall 3',
+                           'dash_secure':
+                           'check inter 5000 rise 2 fall 3 port 70'})
+
+    def test_HorizonHAProxyContext_http(self):
+        self.test_config.set('haproxy-mode', 'http')
+        self.relation_ids.return_value = []
+        self.local_unit.return_value = 'openstack-dashboard/0'
+        self.unit_get.return_value = "10.5.0.1"
+        self.cmp_pkgrevno.return_value = 1
+        with patch_open():
+            ctxt = horizon_contexts.HorizonHAProxyContext()()
+        self.assertEquals(ctxt['http_services'], ['dash_insecure'])
+        self.assertEquals(ctxt['haproxy_cookie'], 'SERVERID')
+        self.assertTrue(ctxt['haproxy_http_keepalive'])
+        self.assertTrue(ctxt['haproxy_http_reuse'])
+        self.assertEquals(ctxt['server_options'],
+                          {'dash_insecure':
+                           'check inter 5000 rise 2 fall 3 slowstart 30000 '
+                           'maxconn 30',
+                           'dash_secure':
+                           'check inter 5000 rise 2 fall 3 slowstart 30000 '
+                           'check-ssl verify none'})
+        self.assertEquals(ctxt['haproxy_queue_timeout'], 30000)
+
+    @patch.object(horizon_contexts.WSGIWorkerConfigContext, 'num_cpus',
+                  new_callable=PropertyMock)
+    def test_HorizonHAProxyContext_http_maxconn(self, _num_cpus):
+        _num_cpus.return_value = 8
+        self.get_total_ram.return_value = 16 * 1024 ** 3
+        self.test_config.set('worker-multiplier', 1.0)
+        self.test_config.set('haproxy-mode', 'http')
+        self.test_config.set('haproxy-http-check', False)
+        self.test_config.set('haproxy-server-timeout', 60000)
+        self.relation_ids.return_value = []
+        self.local_unit.return_value = 'openstack-dashboard/0'
+        self.unit_get.return_value = "10.5.0.1"
+        self.cmp_pkgrevno.return_value = 1
+        with patch_open():
+            ctxt = horizon_contexts.HorizonHAProxyContext()()
+        self.assertEquals(ctxt['server_options'],
+                          {'dash_insecure': 'check maxconn 80',
+                           'dash_secure': 'check'})
+        self.assertEquals(ctxt['haproxy_queue_timeout'], 60000)
+
+    def test_HorizonHAProxyContext_http_old_haproxy(self):
+        self.test_config.set('haproxy-mode', 'http')
+        self.relation_ids.return_value = []
+        self.local_unit.return_value = 'openstack-dashboard/0'
+        self.unit_get.return_value = "10.5.0.1"
+        self.cmp_pkgrevno.return_value = -1
+        with patch_open():
+            ctxt = horizon_contexts.HorizonHAProxyContext()()
+        self.assertFalse(ctxt['haproxy_http_keepalive'])
+        self.assertFalse(ctxt['haproxy_http_reuse'])
+
+    def test_HorizonHAProxyContext_invalid_mode(self):
+        self.test_config.set('haproxy-mode', 'udp')
+        self.relation_ids.return_value = []
+        self.local_unit.return_value = 'openstack-dashboard/0'
+        self.unit_get.return_value = "10.5.0.1"
+        with patch_open():
+            self.assertRaises(Exception,
+                              horizon_contexts.HorizonHAProxyContext())
+        self.assertTrue(self.log.called)
+
+    def test_HorizonHAProxyContext_ssl_termination(self):
+        self.test_config.set('ssl-termination', 'haproxy')
+        self.test_config.set('enforce-ssl', True)
+        self.relation_ids.return_value = []
+        self.local_unit.return_value = 'openstack-dashboard/0'
+        self.unit_get.return_value = "10.5.0.1"
+        self.cmp_pkgrevno.return_value = 1
+        with patch_open():
+            ctxt = horizon_contexts.HorizonHAProxyContext()()
+        self.assertEquals(ctxt['service_ports']['dash_secure'], [443, 70])
+        self.assertEquals(ctxt['http_services'],
+                          ['dash_insecure', 'dash_secure'])
+        self.assertEquals(ctxt['server_options']['dash_secure'],
+                          'check inter 5000 rise 2 fall 3 slowstart 30000 '
+                          'maxconn 30')
+        self.assertEquals(ctxt['ssl_cache_size'], 20000)
+        self.assertEquals(ctxt['ssl_lifetime'], 300)
+        self.assertTrue(ctxt['ssl_redirect'])
+
+    def test_get_ssl_termination_old_haproxy(self):
+        self.test_config.set('ssl-termination', 'haproxy')
+        self.cmp_pkgrevno.return_value = -1
+        self.assertEquals(horizon_contexts.get_ssl_termination(), 'apache')
+        self.assertTrue(self.log.called)
+
+    def test_get_ssl_termination_invalid(self):
+        self.test_config.set('ssl-termination', 'nginx')
+        self.assertRaises(Exception, horizon_contexts.get_ssl_termination)
+        self.assertTrue(self.log.called)
+
+    def test_HAProxySSLContext_apache(self):
+        self.assertEquals(horizon_contexts.HAProxySSLContext()(), {})
+
+    @patch.object(horizon_contexts, 'get_ca_cert', lambda: 'ca')
+    @patch.object(horizon_contexts, 'ApacheSSLContext')
+    @patch('os.path.exists')
+    @patch('os.fdopen')
+    @patch('os.fchmod')
+    @patch('os.open')
+    def test_HAProxySSLContext(self, _os_open, _fchmod, _fdopen, _exists,
+                               _ssl):
+        self.test_config.set('ssl-termination', 'haproxy')
+        self.cmp_pkgrevno.return_value = 1
+        _exists.return_value = False
+        _ssl.return_value.return_value = {
+            'ssl_configured': True,
+            'ssl_cert': '/etc/ssl/certs/dashboard.cert',
+            'ssl_key': '/etc/ssl/private/dashboard.key'}
+        with patch_open() as (_open, _file):
+            _file.read.side_effect = ['cert\n', 'ca\n', 'key\n']
+            self.assertEquals(horizon_contexts.HAProxySSLContext()(),
+                              {'ssl_pem': '/etc/haproxy/dashboard.pem'})
+            _open.assert_has_calls([
+                call('/etc/ssl/certs/dashboard.cert'),
+                call('/usr/local/share/ca-certificates/'
+                     'keystone_juju_ca_cert.crt'),
+                call('/etc/ssl/private/dashboard.key'),
+            ])
+        # created 0600 rather than chmod'ed after being written
+        _os_open.assert_called_once_with(
+            '/etc/haproxy/dashboard.pem',
+            os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        _fchmod.assert_called_once_with(_os_open.return_value, 0o600)
+        _fdopen.assert_called_once_with(_os_open.return_value, 'w')
+        _fdopen.return_value.__enter__.return_value.write.assert_called_with(
+            'cert\nca\nkey\n')
+
+    def test_WSGIWorkerConfigContext_defaults(self):
+        self.cmp_pkgrevno.return_value = -1
+        self.assertEqual(horizon_contexts.WSGIWorkerConfigContext()(),
+                         {'wsgi_processes': 3, 'wsgi_threads': 10,
+                          'wsgi_maximum_requests': 10000})
+
+    @patch.object(horizon_contexts.WSGIWorkerConfigContext, 'num_cpus',
+                  new_callable=PropertyMock)
+    def test_WSGIWorkerConfigContext_multiplier(self, _num_cpus):
+        self.cmp_pkgrevno.return_value = -1
+        _num_cpus.return_value = 32
+        self.get_total_ram.return_value = 64 * 1024 ** 3
+        self.test_config.set('worker-multiplier', 0.5)
+        self.assertEqual(horizon_contexts.WSGIWorkerConfigContext()(),
+                         {'wsgi_processes': 16, 'wsgi_threads': 10,
+                          'wsgi_maximum_requests': 10000})
+
+    @patch.object(horizon_contexts.WSGIWorkerConfigContext, 'num_cpus',
+                  new_callable=PropertyMock)
+    def test_WSGIWorkerConfigContext_min_one_process(self, _num_cpus):
+        self.cmp_pkgrevno.return_value = -1
+        _num_cpus.return_value = 1
+        self.get_total_ram.return_value = 4 * 1024 ** 3
+        self.test_config.set('worker-multiplier', 0.25)
+        self.assertEqual(horizon_contexts.WSGIWorkerConfigContext()(),
+                         {'wsgi_processes': 1, 'wsgi_threads': 10,
+                          'wsgi_maximum_requests': 10000})
+
+    @patch.object(horizon_contexts.WSGIWorkerConfigContext, 'num_cpus',
+                  new_callable=PropertyMock)
+    def test_WSGIWorkerConfigContext_ram_limited(self, _num_cpus):
+        self.cmp_pkgrevno.return_value = -1
+        _num_cpus.return_value = 32
+        self.get_total_ram.return_value = 2 * 1024 ** 3
+        self.test_config.set('worker-multiplier', 1.0)
+        self.test_config.set('wsgi-process-memory', 256)
+        self.assertEqual(horizon_contexts.WSGIWorkerConfigContext()(),
+                         {'wsgi_processes': 4, 'wsgi_threads': 64,
+                          'wsgi_maximum_requests': 10000})
+        self.test_config.set('worker-multiplier', 0.25)
+        self.assertEqual(horizon_contexts.WSGIWorkerConfigContext()(),
+                         {'wsgi_processes': 4, 'wsgi_threads': 20,
+                          'wsgi_maximum_requests': 10000})
+
+    @patch.object(horizon_contexts.WSGIWorkerConfigContext, 'num_cpus',
+                  new_callable=PropertyMock)
+    def test_WSGIWorkerConfigContext_zero_process_memory(self, _num_cpus):
+        self.cmp_pkgrevno.return_value = -1
+        _num_cpus.return_value = 32
+        self.get_total_ram.return_value = 2 * 1024 ** 3
+        self.test_config.set('worker-multiplier', 1.0)
+        self.test_config.set('wsgi-process-memory', 0)
+        # sized as for the 256 MB default
+        self.assertEqual(horizon_contexts.WSGIWorkerConfigContext()(),
+                         {'wsgi_processes': 4, 'wsgi_threads': 64,
+                          'wsgi_maximum_requests': 10000})
+        self.assertTrue(self.log.called)
+
+    def test_WSGIWorkerConfigContext_timeouts(self):
+        self.cmp_pkgrevno.return_value = 1
+        self.test_config.set('wsgi-queue-timeout', 45)
+        self.test_config.set('wsgi-request-timeout', 60)
+        self.test_config.set('wsgi-inactivity-timeout', 600)
+        self.test_config.set('wsgi-graceful-timeout', 0)
+        self.assertEqual(horizon_contexts.WSGIWorkerConfigContext()(),
+                         {'wsgi_processes': 3, 'wsgi_threads': 10,
+                          'wsgi_queue_timeout': 45,
+                          'wsgi_request_timeout': 60,
+                          'wsgi_inactivity_timeout': 600,
+                          'wsgi_maximum_requests': 10000})
+        self.cmp_pkgrevno.assert_called_with('libapache2-mod-wsgi', '4.1')
+
+    def test_WSGIWorkerConfigContext_old_mod_wsgi(self):
+        self.cmp_pkgrevno.return_value = -1
+        self.test_config.set('wsgi-request-timeout', 60)
+        ctxt = horizon_contexts.WSGIWorkerConfigContext()()
+        self.assertFalse('wsgi_queue_timeout' in ctxt)
+        self.assertFalse('wsgi_request_timeout' in ctxt)
+        self.assertFalse('wsgi_graceful_timeout' in ctxt)
+        self.assertTrue(self.log.called)
+
+    @patch.object(horizon_contexts.WSGIWorkerConfigContext, 'num_cpus',
+                  new_callable=PropertyMock)
+    @patch.object(horizon_contexts.ApacheMPMContext, 'num_cpus',
+                  new_callable=PropertyMock)
+    def test_ApacheMPMContext(self, _num_cpus, _wsgi_num_cpus):
+        _num_cpus.return_value = 2
+        self.assertEqual(horizon_contexts.ApacheMPMContext()(),
+                         {'mpm_threads_per_child': 25,
+                          'mpm_server_limit': 6,
+                          'mpm_max_request_workers': 150,
+                          'mpm_max_spare_threads': 75,
+                          'keepalive_timeout': 5})
+        # sized from the mod_wsgi daemon capacity on larger units
+        _num_cpus.return_value = 4
+        _wsgi_num_cpus.return_value = 16
+        self.get_total_ram.return_value = 64 * 1024 ** 3
+        self.test_config.set('worker-multiplier', 1.0)
+        self.assertEqual(horizon_contexts.ApacheMPMContext()(),
+                         {'mpm_threads_per_child': 25,
+                          'mpm_server_limit': 13,
+                          'mpm_max_request_workers': 325,
+                          'mpm_max_spare_threads': 162,
+                          'keepalive_timeout': 5})
+
+    @patch.object(horizon_contexts.SharedDBContext, '__call__')
+    def test_HorizonSharedDBContext(self, _shared_db):
+        _shared_db.return_value = {'database_host': '10.0.0.5',
+                                   'database': 'horizon'}
+        self.assertEqual(
+            horizon_contexts.HorizonSharedDBContext(database='horizon')(),
+            {'database_host': '10.0.0.5',
+             'database': 'horizon',
+             'database_conn_max_age': 60,
+             'database_max_connections': 30})
+
+    @patch.object(horizon_contexts.SharedDBContext, '__call__')
+    def test_HorizonSharedDBContext_incomplete(self, _shared_db):
+        _shared_db.return_value = {}
+        self.assertEqual(
+            horizon_contexts.HorizonSharedDBContext(database='horizon')(),
+            {})
+
+    def test_CacheContext_local(self):
+        self.assertEqual(horizon_contexts.CacheContext()(),
+                         {'cache_backend': horizon_contexts.MEMCACHED_BACKEND,
+                          'cache_servers': ['127.0.0.1:11211'],
+                          'cache_options': {}})
+
+    def test_CacheContext_ring(self):
+        self.test_config.set('memcached-ring', True)
+        self.relation_ids.return_value = ['cluster:0']
+        self.related_units.return_value = [
+            'openstack-dashboard/1', 'openstack-dashboard/2'
+        ]
+        self.relation_get.side_effect = ['10.5.0.3', '10.5.0.2']
+        self.local_unit.return_value = 'openstack-dashboard/0'
+        self.unit_get.return_value = '10.5.0.1'
+        self.assertEqual(horizon_contexts.CacheContext()(),
+                         {'cache_backend': horizon_contexts.PYLIBMC_BACKEND,
+                          'cache_servers': ['10.5.0.1:11211',
+                                            '10.5.0.2:11211',
+                                            '10.5.0.3:11211'],
+                          'cache_options': {'ketama': True,
+                                            'tcp_nodelay': True}})
+
+    def test_CacheContext_pylibmc(self):
+        self.test_config.set('cache-backend', 'pylibmc')
+        self.assertEqual(horizon_contexts.CacheContext()(),
+                         {'cache_backend': horizon_contexts.PYLIBMC_BACKEND,
+                          'cache_servers': ['127.0.0.1:11211'],
+                          'cache_options': {'ketama': True,
+                                            'tcp_nodelay': True}})
+
+    def test_CacheContext_pylibmc_socket(self):
+        self.test_config.set('cache-backend', 'pylibmc')
+        self.test_config.set('memcached-socket', True)
+        self.assertEqual(horizon_contexts.CacheContext()(),
+                         {'cache_backend': horizon_contexts.PYLIBMC_BACKEND,
+                          'cache_servers':
+                          ['/var/lib/memcached/memcached.sock'],
+                          'cache_options': {'ketama': True}})
+
+    def test_CacheContext_invalid_backend(self):
+        self.test_config.set('cache-backend', 'redis')
+        self.assertRaises(Exception, horizon_contexts.CacheContext())
+        self.assertTrue(self.log.called)
+
+    def test_CacheContext_ring_peer_not_ready(self):
+        self.test_config.set('memcached-ring', True)
+        self.relation_ids.return_value = ['cluster:0']
+        self.related_units.return_value = ['openstack-dashboard/1']
+        self.relation_get.side_effect = [None]
+        self.local_unit.return_value = 'openstack-dashboard/0'
+        self.unit_get.return_value = '10.5.0.1'
+        self.assertEqual(horizon_contexts.CacheContext()()['cache_servers'],
+                         ['10.5.0.1:11211'])
+
+    def test_CacheContext_socket(self):
+        self.test_config.set('memcached-socket', True)
+        self.assertEqual(horizon_contexts.CacheContext()()['cache_servers'],
+                         ['unix:/var/lib/memcached/memcached.sock'])
+
+    def test_CacheContext_socket_ring(self):
+        self.test_config.set('memcached-socket', True)
+        self.test_config.set('memcached-ring', True)
+        self.relation_ids.return_value = []
+        self.local_unit.return_value = 'openstack-dashboard/0'
+        self.unit_get.return_value = '10.5.0.1'
+        self.assertEqual(horizon_contexts.CacheContext()()['cache_servers'],
+                         ['10.5.0.1:11211'])
+
+    @patch.object(horizon_contexts.MemcachedContext, 'num_cpus',
+                  new_callable=PropertyMock)
+    def test_MemcachedContext(self, _num_cpus):
+        _num_cpus.return_value = 4
+        self.get_total_ram.return_value = 8 * 1024 ** 3
+        self.assertEqual(horizon_contexts.MemcachedContext()(),
+                         {'memcached_memory': 409,
+                          'memcached_threads': 4,
+                          'memcached_connections': 1024,
+                          'memcached_port': 11211,
+                          'memcached_listen': '127.0.0.1'})
+
+    @patch.object(horizon_contexts.MemcachedContext, 'num_cpus',
+                  new_callable=PropertyMock)
+    def test_MemcachedContext_min_memory(self, _num_cpus):
+        _num_cpus.return_value = 1
+        self.get_total_ram.return_value = 512 * 1024 ** 2
+        ctxt = horizon_contexts.MemcachedContext()()
+        self.assertEqual(ctxt['memcached_memory'], 64)
+        self.assertEqual(ctxt['memcached_threads'], 1)
+
+    @patch.object(horizon_contexts.WSGIWorkerConfigContext, 'num_cpus',
+                  new_callable=PropertyMock)
+    @patch.object(horizon_contexts.MemcachedContext, 'num_cpus',
+                  new_callable=PropertyMock)
+    def test_MemcachedContext_ring(self, _num_cpus, _wsgi_num_cpus):
+        _num_cpus.return_value = 8
+        _wsgi_num_cpus.return_value = 8
+        self.get_total_ram.return_value = 16 * 1024 ** 3
+        self.test_config.set('worker-multiplier', 4.0)
+        self.test_config.set('memcached-ring', True)
+        self.relation_ids.return_value = ['cluster:0']
+        self.related_units.return_value = [
+            'openstack-dashboard/1', 'openstack-dashboard/2'
+        ]
+        self.relation_get.side_effect = ['10.5.0.2', '10.5.0.3']
+        self.local_unit.return_value = 'openstack-dashboard/0'
+        self.unit_get.return_value = '10.5.0.1'
+        self.assertEqual(horizon_contexts.MemcachedContext()(),
+                         {'memcached_memory': 819,
+                          'memcached_threads': 8,
+                          'memcached_connections': 1920,
+                          'memcached_port': 11211,
+                          'memcached_listen': '127.0.0.1,10.5.0.1'})
+
+    @patch.object(horizon_contexts.MemcachedContext, 'num_cpus',
+                  new_callable=PropertyMock)
+    def test_MemcachedContext_socket(self, _num_cpus):
+        _num_cpus.return_value = 2
+        self.get_total_ram.return_value = 4 * 1024 ** 3
+        self.test_config.set('memcached-socket', True)
+        self.assertEqual(horizon_contexts.MemcachedContext()(),
+                         {'memcached_memory': 204,
+                          'memcached_threads': 2,
+                          'memcached_connections': 1024,
+                          'memcached_socket':
+                          '/var/lib/memcached/memcached.sock'})
+
     def test_RouterSettingContext(self):
         self.test_config.set('profile', 'cisco')
         self.assertEquals(horizon_contexts.RouterSettingContext()(),
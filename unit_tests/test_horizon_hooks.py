@@ -45,11 +45,16 @@ TO_PATCH = [
     'apt_update',
     'apt_install',
     'filter_installed_packages',
+    'determine_packages',
     'open_port',
     'CONFIGS',
     'get_hacluster_config',
     'relation_ids',
     'enable_ssl',
+    'enable_static_caching',
+    'enable_http2',
+    'enable_mpm_event',
+    'setup_memcached_socket',
     'openstack_upgrade_available',
     'do_openstack_upgrade',
     'save_script_rc',
@@ -63,6 +68,11 @@ TO_PATCH = [
     'get_netmask_for_address',
     'git_install',
     'git_post_install_late',
+    'precompress_static',
+    'update_ocsp_response',
+    'is_unit_paused_set',
+    'precompile_templates',
+    'service_reload',
     'update_nrpe_config',
     'lsb_release',
     'status_set',
@@ -81,6 +91,11 @@ class TestHorizonHooks(CharmTestCase):
         self.config.side_effect = self.test_config.get
         self.b64decode.side_effect = passthrough
         hooks.hooks._config_save = False
+        # keep restart_on_change() away from the real unitdata database
+        self.is_unit_paused_set.return_value = False
+        paused = patch.object(utils, 'is_unit_paused_set', return_value=False)
+        paused.start()
+        self.addCleanup(paused.stop)
 
     def _call_hook(self, hookname):
         hooks.hooks.execute([
@@ -179,22 +194,69 @@ class TestHorizonHooks(CharmTestCase):
                                 _determine_packages):
         _determine_packages.return_value = []
         _git_requested.return_value = False
+        # templated files are reported by the renderer, others are hashed
+        rendered = [f for f in RESTART_MAP.keys() if f in utils.CONFIG_FILES]
+        hashed = [f for f in RESTART_MAP.keys() if f not in rendered]
         side_effects = []
-        [side_effects.append(None) for f in RESTART_MAP.keys()]
-        [side_effects.append('bar') for f in RESTART_MAP.keys()]
+        [side_effects.append(None) for f in hashed]
+        [side_effects.append('bar') for f in hashed]
         _hash.side_effect = side_effects
+        self.CONFIGS.write_all.side_effect = \
+            lambda: utils.CHANGED_FILES.extend(rendered)
+        self.addCleanup(utils.CHANGED_FILES.__delitem__, slice(None))
         self.filter_installed_packages.return_value = ['foo']
         self._call_hook('upgrade-charm')
         self.apt_install.assert_called_with(['foo'], fatal=True)
+        self.assertTrue(self.precompile_templates.called)
         self.assertTrue(self.CONFIGS.write_all.called)
         ex = [
             call('stop', 'apache2'),
             call('stop', 'haproxy'),
+            call('stop', 'memcached'),
             call('start', 'apache2'),
             call('start', 'haproxy'),
+            call('start', 'memcached'),
         ]
         self.assertEquals(ex, _service.call_args_list)
 
+    @patch.object(hooks, 'hook_name')
+    @patch.object(hooks, 'record_interface_status')
+    @patch.object(hooks, 'recorded_interface_status')
+    @patch.object(hooks, 'assess_status')
+    @patch.object(hooks.hooks, 'execute')
+    def test_main_status_only_hook(self, _execute, _assess_status,
+                                   _recorded, _record, _hook_name):
+        _hook_name.return_value = 'update-status'
+        hooks.main()
+        _assess_status.assert_called_once_with(_recorded.return_value)
+        self.assertFalse(_record.called)
+
+    @patch.object(hooks, 'hook_name')
+    @patch.object(hooks, 'record_interface_status')
+    @patch.object(hooks, 'recorded_interface_status')
+    @patch.object(hooks, 'assess_status')
+    @patch.object(hooks.hooks, 'execute')
+    def test_main_status_only_hook_unrecorded(self, _execute, _assess_status,
+                                              _recorded, _record, _hook_name):
+        _hook_name.return_value = 'update-status'
+        _recorded.return_value = None
+        hooks.main()
+        _record.assert_called_once_with(self.CONFIGS)
+        _assess_status.assert_called_once_with(self.CONFIGS)
+
+    @patch.object(hooks, 'hook_name')
+    @patch.object(hooks, 'record_interface_status')
+    @patch.object(hooks, 'recorded_interface_status')
+    @patch.object(hooks, 'assess_status')
+    @patch.object(hooks.hooks, 'execute')
+    def test_main_rendering_hook(self, _execute, _assess_status,
+                                 _recorded, _record, _hook_name):
+        _hook_name.return_value = 'config-changed'
+        hooks.main()
+        self.assertFalse(_recorded.called)
+        _record.assert_called_once_with(self.CONFIGS)
+        _assess_status.assert_called_once_with(self.CONFIGS)
+
     def test_ha_joined_complete_config(self):
         conf = {
             'ha-bindiface': 'eth100',
@@ -309,10 +371,58 @@ class TestHorizonHooks(CharmTestCase):
             'openstack-dashboard'
         )
         self.assertTrue(self.enable_ssl.called)
+        self.assertTrue(self.enable_mpm_event.called)
+        self.assertTrue(self.enable_http2.called)
+        self.assertTrue(self.enable_static_caching.called)
+        self.assertTrue(self.setup_memcached_socket.called)
         self.do_openstack_upgrade.assert_not_called()
         self.assertTrue(self.save_script_rc.called)
         self.assertTrue(self.CONFIGS.write_all.called)
         self.open_port.assert_has_calls([call(80), call(443)])
+        self.assertFalse(self.precompress_static.called)
+
+    @patch('horizon_hooks.keystone_joined')
+    @patch.object(hooks, 'git_install_requested')
+    def test_config_changed_static_precompression(self, _git_requested,
+                                                  _joined):
+        _git_requested.return_value = False
+        self.relation_ids.return_value = []
+        self.openstack_upgrade_available.return_value = False
+        self.test_config.set('static-precompression', True)
+        self._call_hook('config-changed')
+        self.assertTrue(self.precompress_static.called)
+
+    def test_update_status_ocsp(self):
+        self.update_ocsp_response.return_value = True
+        self._call_hook('update-status')
+        self.service_reload.assert_called_with('haproxy')
+
+    @patch.object(utils, 'kv')
+    @patch.object(utils.horizon_contexts, 'cmp_pkgrevno')
+    @patch.object(utils, 'cmp_pkgrevno')
+    def test_update_status_no_ssl_termination(self, _cmp_pkgrevno,
+                                              _ctxt_cmp_pkgrevno, _kv):
+        self.update_ocsp_response.side_effect = utils.update_ocsp_response
+        with patch.object(utils, 'config', self.config):
+            self._call_hook('update-status')
+        self.assertFalse(_cmp_pkgrevno.called)
+        self.assertFalse(_ctxt_cmp_pkgrevno.called)
+        self.assertFalse(_kv.called)
+        self.assertFalse(self.apt_update.called)
+        self.assertFalse(self.apt_install.called)
+        self.assertFalse(self.filter_installed_packages.called)
+        self.assertFalse(self.service_reload.called)
+
+    def test_update_status_ocsp_paused(self):
+        self.is_unit_paused_set.return_value = True
+        self.update_ocsp_response.return_value = True
+        self._call_hook('update-status')
+        self.assertFalse(self.service_reload.called)
+
+    def test_update_status_ocsp_unchanged(self):
+        self.update_ocsp_response.return_value = False
+        self._call_hook('update-status')
+        self.assertFalse(self.service_reload.called)
 
     @patch.object(hooks, 'git_install_requested')
     def test_config_changed_do_upgrade(self, _git_requested):
@@ -383,6 +493,15 @@ class TestHorizonHooks(CharmTestCase):
         self._call_hook('cluster-relation-changed')
         self.CONFIGS.write.assert_called_with('/etc/haproxy/haproxy.cfg')
 
+    def test_cluster_changed_memcached_ring(self):
+        self.test_config.set('memcached-ring', True)
+        self._call_hook('cluster-relation-changed')
+        self.CONFIGS.write.assert_has_calls([
+            call('/etc/openstack-dashboard/local_settings.py'),
+            call('/etc/memcached.conf'),
+            call('/etc/haproxy/haproxy.cfg'),
+        ])
+
     def test_website_joined(self):
         self.unit_get.return_value = '192.168.1.1'
         self._call_hook('website-relation-joined')
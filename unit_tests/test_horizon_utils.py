@@ -12,11 +12,17 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from mock import MagicMock, patch, call
+from mock import MagicMock, patch, call, ANY
+import gzip
+import logging
+import logging.config
+import logging.handlers
 import os
+import shutil
+import tempfile
 from collections import OrderedDict
-import charmhelpers.contrib.openstack.templating as templating
-templating.OSConfigRenderer = MagicMock()
+from charmhelpers.contrib.openstack.context import OSContextGenerator
+import charmhelpers.core.hookenv as hookenv
 import horizon_utils as horizon_utils
 
 from test_utils import (
@@ -45,16 +51,44 @@ openstack_origin_git = \
             branch: stable/juno}"""
 
 
+class CountingContext(OSContextGenerator):
+    interfaces = ['counting']
+    calls = 0
+
+    def __init__(self, value):
+        self.value = value
+
+    def __call__(self):
+        CountingContext.calls += 1
+        return {'value': self.value}
+
+
+class StaticContext(OSContextGenerator):
+    interfaces = []
+
+    def __init__(self, **ctxt):
+        self.ctxt = ctxt
+
+    def __call__(self):
+        return self.ctxt
+
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(__file__), '..', 'templates')
+
+
 class TestHorizohorizon_utils(CharmTestCase):
 
     def setUp(self):
         super(TestHorizohorizon_utils, self).setUp(horizon_utils, TO_PATCH)
 
+    @patch.object(horizon_utils.horizon_contexts, 'get_cache_backend')
     @patch.object(horizon_utils, 'get_os_codename_install_source')
     @patch.object(horizon_utils, 'git_install_requested')
     def test_determine_packages(self, _git_install_requested,
-                                _get_os_codename_install_source):
+                                _get_os_codename_install_source,
+                                _get_cache_backend):
         _git_install_requested.return_value = False
+        _get_cache_backend.return_value = 'python-memcache'
         _get_os_codename_install_source.return_value = 'icehouse'
         self.assertEqual(horizon_utils.determine_packages(), [
             'haproxy',
@@ -65,14 +99,45 @@ class TestHorizohorizon_utils(CharmTestCase):
             'openstack-dashboard',
             'memcached'])
 
+    @patch.object(horizon_utils.horizon_contexts, 'get_cache_backend')
     @patch.object(horizon_utils, 'get_os_codename_install_source')
     @patch.object(horizon_utils, 'git_install_requested')
     def test_determine_packages_mitaka(self, _git_install_requested,
-                                       _get_os_codename_install_source):
+                                       _get_os_codename_install_source,
+                                       _get_cache_backend):
         _git_install_requested.return_value = False
+        _get_cache_backend.return_value = 'python-memcache'
         _get_os_codename_install_source.return_value = 'mitaka'
         self.assertTrue('python-pymysql' in horizon_utils.determine_packages())
 
+    @patch.object(horizon_utils.horizon_contexts, 'get_cache_backend')
+    @patch.object(horizon_utils, 'get_os_codename_install_source')
+    @patch.object(horizon_utils, 'git_install_requested')
+    def test_determine_packages_pylibmc(
+            self, _git_install_requested, _get_os_codename_install_source,
+            _get_cache_backend):
+        _git_install_requested.return_value = False
+        _get_os_codename_install_source.return_value = 'mitaka'
+        _get_cache_backend.return_value = 'python-memcache'
+        self.assertFalse('python-pylibmc' in
+                         horizon_utils.determine_packages())
+        _get_cache_backend.return_value = 'pylibmc'
+        self.assertTrue('python-pylibmc' in
+                        horizon_utils.determine_packages())
+
+    @patch.object(horizon_utils.horizon_contexts, 'get_cache_backend')
+    @patch.object(horizon_utils, 'get_os_codename_install_source')
+    @patch.object(horizon_utils, 'git_install_requested')
+    def test_determine_packages_pylibmc_git(
+            self, _git_install_requested, _get_os_codename_install_source,
+            _get_cache_backend):
+        _git_install_requested.return_value = True
+        _get_os_codename_install_source.return_value = 'mitaka'
+        _get_cache_backend.return_value = 'pylibmc'
+        packages = horizon_utils.determine_packages()
+        self.assertTrue('libmemcached-dev' in packages)
+        self.assertFalse('python-pylibmc' in packages)
+
     @patch('subprocess.call')
     def test_enable_ssl(self, _call):
         horizon_utils.enable_ssl()
@@ -81,6 +146,209 @@ class TestHorizohorizon_utils(CharmTestCase):
             call(['a2enmod', 'ssl'])
         ])
 
+    @patch('subprocess.call')
+    def test_enable_mpm_event(self, _call):
+        self.test_config.set('apache-mpm-event', True)
+        self.config.side_effect = self.test_config.get
+        self.cmp_pkgrevno.return_value = 1
+        horizon_utils.enable_mpm_event()
+        _call.assert_has_calls([
+            call(['a2dismod', 'mpm_prefork']),
+            call(['a2dismod', 'mpm_worker']),
+            call(['a2enmod', 'mpm_event']),
+        ])
+
+    @patch('subprocess.call')
+    @patch.object(horizon_utils.horizon_contexts, 'http2_enabled')
+    def test_enable_mpm_event_unset(self, _http2_enabled, _call):
+        self.config.side_effect = self.test_config.get
+        _http2_enabled.return_value = False
+        self.cmp_pkgrevno.return_value = 1
+        horizon_utils.enable_mpm_event()
+        self.assertFalse(_call.called)
+
+    @patch('subprocess.call')
+    @patch.object(horizon_utils.horizon_contexts, 'http2_enabled')
+    def test_enable_mpm_event_http2(self, _http2_enabled, _call):
+        self.config.side_effect = self.test_config.get
+        _http2_enabled.return_value = True
+        self.cmp_pkgrevno.return_value = 1
+        horizon_utils.enable_mpm_event()
+        _call.assert_has_calls([
+            call(['a2dismod', 'mpm_prefork']),
+            call(['a2dismod', 'mpm_worker']),
+            call(['a2enmod', 'mpm_event']),
+        ])
+
+    @patch('subprocess.call')
+    def test_enable_mpm_event_apache22(self, _call):
+        self.test_config.set('apache-mpm-event', True)
+        self.config.side_effect = self.test_config.get
+        self.cmp_pkgrevno.return_value = -1
+        horizon_utils.enable_mpm_event()
+        self.assertFalse(_call.called)
+
+    @patch('subprocess.call')
+    @patch.object(horizon_utils.horizon_contexts, 'http2_enabled')
+    def test_enable_http2(self, _http2_enabled, _call):
+        _http2_enabled.return_value = True
+        horizon_utils.enable_http2()
+        _call.assert_called_once_with(['a2enmod', 'http2'])
+
+    @patch('subprocess.call')
+    @patch.object(horizon_utils.horizon_contexts, 'http2_enabled')
+    def test_enable_http2_disabled(self, _http2_enabled, _call):
+        _http2_enabled.return_value = False
+        horizon_utils.enable_http2()
+        _call.assert_called_once_with(['a2dismod', 'http2'])
+
+    @patch.object(horizon_utils.templating, 'log')
+    def test_default_ssl_http2(self, _log):
+        templating = horizon_utils.templating
+        templates = os.path.join(os.path.dirname(__file__), '..', 'templates')
+        env = templating.Environment(
+            loader=templating.get_loader(templates, 'mitaka'))
+        template = env.get_template('default-ssl.conf')
+        self.assertIn('Protocols h2 http/1.1',
+                      template.render(https_port=443, http2=True))
+        self.assertNotIn('Protocols',
+                         template.render(https_port=443, http2=False))
+
+    @patch('subprocess.call')
+    def test_enable_static_caching(self, _call):
+        horizon_utils.enable_static_caching()
+        _call.assert_has_calls([
+            call(['a2enmod', 'expires']),
+            call(['a2enmod', 'headers']),
+            call(['a2enmod', 'rewrite'])
+        ])
+
+    @patch.object(horizon_utils, 'brotli', None)
+    def test_precompress_static(self):
+        static_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, static_dir)
+        bundle = os.path.join(static_dir, '0123456789ab.js')
+        with open(bundle, 'w') as f:
+            f.write('var a = 1;\n' * 200)
+        small = os.path.join(static_dir, 'small.css')
+        with open(small, 'w') as f:
+            f.write('a {}\n')
+        image = os.path.join(static_dir, 'logo.png')
+        with open(image, 'w') as f:
+            f.write('x' * 2048)
+        orphan = os.path.join(static_dir, 'gone.css.gz')
+        with open(orphan, 'w') as f:
+            f.write('stale')
+        stale_br = bundle + '.br'
+        with open(stale_br, 'w') as f:
+            f.write('stale')
+
+        horizon_utils.precompress_static(static_dir)
+
+        self.assertEqual(sorted(os.listdir(static_dir)),
+                         ['0123456789ab.js', '0123456789ab.js.gz',
+                          'logo.png', 'small.css'])
+        gz = gzip.open(bundle + '.gz')
+        self.assertEqual(gz.read(), 'var a = 1;\n' * 200)
+        gz.close()
+        self.assertEqual(int(os.stat(bundle + '.gz').st_mtime),
+                         int(os.stat(bundle).st_mtime))
+
+    @patch.object(horizon_utils, '_gzip')
+    def test_precompress_static_up_to_date(self, _gzip):
+        static_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, static_dir)
+        bundle = os.path.join(static_dir, 'style.css')
+        with open(bundle, 'w') as f:
+            f.write('a { color: red; }\n' * 100)
+        with open(bundle + '.gz', 'w') as f:
+            f.write('compressed')
+        st = os.stat(bundle)
+        os.utime(bundle + '.gz', (st.st_atime, st.st_mtime))
+        with patch.object(horizon_utils, 'brotli', None):
+            horizon_utils.precompress_static(static_dir)
+        self.assertFalse(_gzip.called)
+
+    @patch.object(horizon_utils, 'mkdir')
+    @patch.object(horizon_utils.horizon_contexts, 'get_memcached_socket')
+    def test_setup_memcached_socket(self, _get_socket, _mkdir):
+        _get_socket.return_value = '/var/lib/memcached/memcached.sock'
+        horizon_utils.setup_memcached_socket()
+        _mkdir.assert_called_with('/var/lib/memcached', owner='memcache',
+                                  group='memcache', perms=0o755)
+
+    @patch.object(horizon_utils, 'mkdir')
+    @patch.object(horizon_utils.horizon_contexts, 'get_memcached_socket')
+    def test_setup_memcached_socket_tcp(self, _get_socket, _mkdir):
+        _get_socket.return_value = None
+        horizon_utils.setup_memcached_socket()
+        self.assertFalse(_mkdir.called)
+
+    @patch.object(horizon_utils, 'kv')
+    @patch('subprocess.check_call')
+    @patch.object(horizon_utils.horizon_contexts, 'cmp_pkgrevno')
+    def test_update_ocsp_response_apache(self, _cmp_pkgrevno, _check_call,
+                                         _kv):
+        self.config.side_effect = self.test_config.get
+        self.assertFalse(horizon_utils.update_ocsp_response())
+        self.assertFalse(_cmp_pkgrevno.called)
+        self.assertFalse(_kv.called)
+        self.assertFalse(_check_call.called)
+
+    @patch.object(horizon_utils, 'kv')
+    @patch('os.path.getmtime')
+    @patch('os.rename')
+    @patch('os.path.exists')
+    @patch('subprocess.check_call')
+    @patch('subprocess.check_output')
+    @patch.object(horizon_utils.horizon_contexts, 'get_ssl_termination')
+    def test_update_ocsp_response(self, _termination, _check_output,
+                                  _check_call, _exists, _rename, _getmtime,
+                                  _kv):
+        self.test_config.set('ssl-termination', 'haproxy')
+        self.config.side_effect = self.test_config.get
+        _termination.return_value = 'haproxy'
+        _exists.side_effect = lambda f: not f.endswith('.ocsp')
+        _getmtime.return_value = 1000
+        _kv.return_value.get.return_value = None
+        _check_output.return_value = 'http://ocsp.example.com\n'
+        self.assertTrue(horizon_utils.update_ocsp_response())
+        _kv.return_value.set.assert_called_with('ocsp-last-attempt', ANY)
+        _check_call.assert_called_with([
+            'openssl', 'ocsp', '-no_nonce', '-timeout', '10',
+            '-issuer',
+            '/usr/local/share/ca-certificates/keystone_juju_ca_cert.crt',
+            '-cert', '/etc/ssl/certs/dashboard.cert',
+            '-url', 'http://ocsp.example.com',
+            '-respout', '/etc/haproxy/dashboard.pem.ocsp.tmp'])
+        _rename.assert_called_with('/etc/haproxy/dashboard.pem.ocsp.tmp',
+                                   '/etc/haproxy/dashboard.pem.ocsp')
+
+    @patch.object(horizon_utils, 'kv')
+    @patch('time.time')
+    @patch('os.path.getmtime')
+    @patch('os.path.exists')
+    @patch('subprocess.check_call')
+    @patch('subprocess.check_output')
+    @patch.object(horizon_utils.horizon_contexts, 'get_ssl_termination')
+    def test_update_ocsp_response_backoff(self, _termination, _check_output,
+                                          _check_call, _exists, _getmtime,
+                                          _time, _kv):
+        self.test_config.set('ssl-termination', 'haproxy')
+        self.config.side_effect = self.test_config.get
+        _termination.return_value = 'haproxy'
+        _exists.side_effect = lambda f: not f.endswith('.ocsp')
+        _getmtime.return_value = 1000
+        _kv.return_value.get.return_value = 2000
+        _time.return_value = 2000 + horizon_utils.OCSP_RETRY_INTERVAL - 1
+        self.assertFalse(horizon_utils.update_ocsp_response())
+        self.assertFalse(_check_call.called)
+        # a new certificate is fetched for straight away
+        _getmtime.return_value = 3000
+        _check_output.return_value = ''
+        horizon_utils.update_ocsp_response()
+        self.assertTrue(_check_output.called)
+
     def test_restart_map(self):
         ex_map = OrderedDict([
             ('/etc/openstack-dashboard/local_settings.py', ['apache2']),
@@ -92,11 +360,14 @@ class TestHorizohorizon_utils(CharmTestCase):
             ('/etc/apache2/sites-available/default', ['apache2']),
             ('/etc/apache2/sites-available/000-default.conf', ['apache2']),
             ('/etc/apache2/ports.conf', ['apache2']),
+            ('/etc/apache2/mods-available/mpm_event.conf', ['apache2']),
             ('/etc/haproxy/haproxy.cfg', ['haproxy']),
+            ('/etc/memcached.conf', ['memcached']),
             ('/usr/share/openstack-dashboard/openstack_dashboard/enabled/'
              '_40_router.py', ['apache2']),
             ('/usr/share/openstack-dashboard/openstack_dashboard/conf/'
              'keystonev3_policy.json', ['apache2']),
+            ('/etc/haproxy/dashboard.pem', ['haproxy']),
         ])
         self.assertEquals(horizon_utils.restart_map(), ex_map)
 
@@ -118,14 +389,16 @@ class TestHorizohorizon_utils(CharmTestCase):
             'cloud:precise-havana'
         )
 
+    @patch.object(horizon_utils, 'HorizonConfigRenderer')
     @patch('os.path.isdir')
-    def test_register_configs(self, _isdir):
+    def test_register_configs(self, _isdir, _renderer):
         _isdir.return_value = True
         self.os_release.return_value = 'havana'
         self.cmp_pkgrevno.return_value = -1
         configs = horizon_utils.register_configs()
         confs = [horizon_utils.LOCAL_SETTINGS,
                  horizon_utils.HAPROXY_CONF,
+                 horizon_utils.MEMCACHED_CONF,
                  horizon_utils.PORTS_CONF,
                  horizon_utils.APACHE_DEFAULT,
                  horizon_utils.APACHE_CONF,
@@ -137,10 +410,12 @@ class TestHorizohorizon_utils(CharmTestCase):
                      horizon_utils.CONFIG_FILES[conf]['hook_contexts']))
         configs.register.assert_has_calls(calls)
 
+    @patch.object(horizon_utils, 'HorizonConfigRenderer')
     @patch('os.remove')
     @patch('os.path.isfile')
     @patch('os.path.isdir')
-    def test_register_configs_apache24(self, _isdir, _isfile, _remove):
+    def test_register_configs_apache24(self, _isdir, _isfile, _remove,
+                                       _renderer):
         _isdir.return_value = True
         _isfile.return_value = True
         self.os_release.return_value = 'havana'
@@ -148,10 +423,12 @@ class TestHorizohorizon_utils(CharmTestCase):
         configs = horizon_utils.register_configs()
         confs = [horizon_utils.LOCAL_SETTINGS,
                  horizon_utils.HAPROXY_CONF,
+                 horizon_utils.MEMCACHED_CONF,
                  horizon_utils.PORTS_CONF,
                  horizon_utils.APACHE_24_DEFAULT,
                  horizon_utils.APACHE_24_CONF,
-                 horizon_utils.APACHE_24_SSL]
+                 horizon_utils.APACHE_24_SSL,
+                 horizon_utils.MPM_EVENT_CONF]
         calls = []
         for conf in confs:
             calls.append(
@@ -165,13 +442,15 @@ class TestHorizohorizon_utils(CharmTestCase):
             rmcalls.append(call(conf))
         _remove.assert_has_calls(rmcalls)
 
+    @patch.object(horizon_utils, 'HorizonConfigRenderer')
     @patch('os.path.isdir')
-    def test_register_configs_pre_install(self, _isdir):
+    def test_register_configs_pre_install(self, _isdir, _renderer):
         _isdir.return_value = False
         self.os_release.return_value = None
         configs = horizon_utils.register_configs()
         confs = [horizon_utils.LOCAL_SETTINGS,
                  horizon_utils.HAPROXY_CONF,
+                 horizon_utils.MEMCACHED_CONF,
                  horizon_utils.PORTS_CONF,
                  horizon_utils.APACHE_DEFAULT,
                  horizon_utils.APACHE_CONF,
@@ -338,6 +617,86 @@ class TestHorizohorizon_utils(CharmTestCase):
         ]
         self.assertEquals(service_restart.call_args_list, expected)
 
+    @patch.object(horizon_utils, 'build_static')
+    @patch.object(horizon_utils, 'static_fingerprint')
+    @patch.object(horizon_utils, 'kv')
+    @patch.object(horizon_utils, 'is_unit_paused_set')
+    @patch.object(horizon_utils, 'service_restart')
+    @patch('subprocess.check_call')
+    def test_git_post_install_late(self, check_call, service_restart,
+                                   is_paused, kv, fingerprint, build_static):
+        is_paused.return_value = False
+        kv.return_value.get.return_value = 'old'
+        fingerprint.return_value = 'new'
+        horizon_utils.git_post_install_late(openstack_origin_git)
+        check_call.assert_called_with(['a2enconf', 'openstack-dashboard'])
+        service_restart.assert_called_with('apache2')
+        self.assertTrue(build_static.called)
+
+    @patch.object(horizon_utils, 'build_static')
+    @patch.object(horizon_utils, 'static_fingerprint')
+    @patch.object(horizon_utils, 'kv')
+    @patch.object(horizon_utils, 'is_unit_paused_set')
+    @patch.object(horizon_utils, 'service_restart')
+    @patch('subprocess.check_call')
+    def test_git_post_install_late_unchanged(self, check_call,
+                                             service_restart, is_paused, kv,
+                                             fingerprint, build_static):
+        is_paused.return_value = False
+        kv.return_value.get.return_value = 'same'
+        fingerprint.return_value = 'same'
+        horizon_utils.git_post_install_late(openstack_origin_git)
+        self.assertFalse(build_static.called)
+        horizon_utils.git_post_install_late(openstack_origin_git, force=True)
+        self.assertTrue(build_static.called)
+
+    @patch.object(horizon_utils, 'static_fingerprint')
+    @patch.object(horizon_utils, 'kv')
+    @patch('subprocess.check_call')
+    def test_build_static(self, check_call, kv, fingerprint):
+        fingerprint.return_value = 'abc'
+        horizon_utils.build_static(openstack_origin_git)
+        manage = '/usr/share/openstack-dashboard/manage.py'
+        check_call.assert_has_calls([
+            call([ANY, manage, 'collectstatic', '--noinput']),
+            call([ANY, manage, 'compress', '--force']),
+        ])
+        kv.return_value.set.assert_called_with('static-fingerprint', 'abc')
+        self.assertTrue(kv.return_value.flush.called)
+
+    @patch.object(horizon_utils, 'git_pip_venv_dir')
+    def test_static_fingerprint(self, git_pip_venv_dir):
+        src_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, src_dir)
+        static_dir = os.path.join(src_dir, 'static')
+        os.mkdir(static_dir)
+        venv_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, venv_dir)
+        git_pip_venv_dir.return_value = venv_dir
+        with open(os.path.join(src_dir, 'settings.py'), 'w') as f:
+            f.write('DEBUG = False\n')
+
+        with patch.object(horizon_utils, 'STATIC_SOURCE_DIRS', [src_dir]), \
+                patch.object(horizon_utils, 'STATIC_DIR', static_dir):
+            before = horizon_utils.static_fingerprint(openstack_origin_git)
+            # output and bytecode do not count as inputs
+            with open(os.path.join(static_dir, 'out.js'), 'w') as f:
+                f.write('compressed')
+            with open(os.path.join(src_dir, 'settings.pyc'), 'w') as f:
+                f.write('bytecode')
+            self.assertEqual(
+                horizon_utils.static_fingerprint(openstack_origin_git),
+                before)
+            # compression options and plugins do
+            self.config.return_value = 'changed'
+            changed = horizon_utils.static_fingerprint(openstack_origin_git)
+            self.assertNotEqual(changed, before)
+            with open(os.path.join(venv_dir, 'plugin.py'), 'w') as f:
+                f.write('PANEL = "plugin"\n')
+            self.assertNotEqual(
+                horizon_utils.static_fingerprint(openstack_origin_git),
+                changed)
+
     def test_assess_status(self):
         with patch.object(horizon_utils, 'assess_status_func') as asf:
             callee = MagicMock()
@@ -360,7 +719,28 @@ class TestHorizohorizon_utils(CharmTestCase):
         horizon_utils.assess_status_func('test-config')
         # ports=None whilst port checks are disabled.
         make_assess_status_func.assert_called_once_with(
-            'test-config', REQUIRED_INTERFACES, services='s1', ports=None)
+            'test-config', REQUIRED_INTERFACES,
+            charm_func=horizon_utils.check_optional_relations,
+            services='s1', ports=None)
+
+    @patch.object(horizon_utils, 'relation_ids')
+    def test_check_optional_relations(self, relation_ids):
+        self.config.side_effect = self.test_config.get
+        configs = MagicMock()
+        self.assertEqual(horizon_utils.check_optional_relations(configs),
+                         ('unknown', ''))
+        self.test_config.set('session-engine', 'db')
+        relation_ids.return_value = []
+        self.assertEqual(horizon_utils.check_optional_relations(configs),
+                         ('blocked', 'session-engine db requires the '
+                          'shared-db relation'))
+        relation_ids.return_value = ['shared-db:0']
+        configs.complete_contexts.return_value = ['identity-service']
+        self.assertEqual(horizon_utils.check_optional_relations(configs),
+                         ('waiting', 'Incomplete relations: shared-db'))
+        configs.complete_contexts.return_value = ['shared-db']
+        self.assertEqual(horizon_utils.check_optional_relations(configs),
+                         ('unknown', ''))
 
     def test_pause_unit_helper(self):
         with patch.object(horizon_utils, '_pause_resume_helper') as prh:
@@ -382,3 +762,323 @@ class TestHorizohorizon_utils(CharmTestCase):
             asf.assert_called_once_with('some-config')
             # ports=None whilst port checks are disabled.
             f.assert_called_once_with('assessor', services='s1', ports=None)
+
+    def _renderer(self, templates, tmpl_dir=None):
+        if tmpl_dir is None:
+            tmpl_dir = tempfile.mkdtemp()
+            self.addCleanup(shutil.rmtree, tmpl_dir)
+        for name, content in templates.items():
+            with open(os.path.join(tmpl_dir, name), 'w') as f:
+                f.write(content)
+        out_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, out_dir)
+        local_unit = patch.object(horizon_utils, 'local_unit',
+                                  return_value='openstack-dashboard/0')
+        local_unit.start()
+        self.addCleanup(local_unit.stop)
+        charm_dir = patch.object(horizon_utils, 'charm_dir',
+                                 return_value=None)
+        charm_dir.start()
+        self.addCleanup(charm_dir.stop)
+        templating_log = patch.object(horizon_utils.templating, 'log')
+        templating_log.start()
+        self.addCleanup(templating_log.stop)
+        self.addCleanup(hookenv.cache.clear)
+        self.addCleanup(horizon_utils.CHANGED_FILES.__delitem__, slice(None))
+        CountingContext.calls = 0
+        renderer = horizon_utils.HorizonConfigRenderer(
+            templates_dir=tmpl_dir, openstack_release='mitaka')
+        return renderer, out_dir
+
+    @patch.object(horizon_utils, 'kv')
+    def test_record_interface_status(self, kv):
+        configs = MagicMock()
+        configs.complete_contexts.return_value = ['shared-db']
+        configs.get_incomplete_context_data.return_value = {
+            'identity-service': {'related': False}}
+        horizon_utils.record_interface_status(configs)
+        configs.get_incomplete_context_data.assert_called_once_with(
+            ['identity-service'])
+        kv.return_value.set.assert_called_once_with(
+            'horizon-interface-status',
+            {'complete': ['shared-db'],
+             'incomplete': {'identity-service': {'related': False}}})
+        self.assertTrue(kv.return_value.flush.called)
+
+    @patch.object(horizon_utils, 'kv')
+    def test_recorded_interface_status(self, kv):
+        kv.return_value.get.return_value = None
+        self.assertEqual(horizon_utils.recorded_interface_status(), None)
+        kv.return_value.get.return_value = {
+            'complete': ['shared-db'],
+            'incomplete': {'identity-service': {'related': False}}}
+        status = horizon_utils.recorded_interface_status()
+        self.assertEqual(status.complete_contexts(), ['shared-db'])
+        self.assertEqual(
+            status.get_incomplete_context_data(['identity-service']),
+            {'identity-service': {'related': False}})
+        self.assertEqual(status.get_incomplete_context_data(['amqp']), {})
+
+    def test_renderer_evaluates_contexts_once(self):
+        renderer, out_dir = self._renderer({'a.conf': 'a={{ value }}',
+                                            'b.conf': 'b={{ value }}'})
+        a = os.path.join(out_dir, 'a.conf')
+        b = os.path.join(out_dir, 'b.conf')
+        # equal generators registered against different files are shared
+        renderer.register(a, [CountingContext('x')])
+        renderer.register(b, [CountingContext('x')])
+        renderer.write_all()
+        self.assertEqual(CountingContext.calls, 1)
+        self.assertEqual(renderer.complete_contexts(),
+                         ['counting', 'counting'])
+        self.assertEqual(CountingContext.calls, 1)
+        with open(a) as f:
+            self.assertEqual(f.read(), 'a=x')
+        with open(b) as f:
+            self.assertEqual(f.read(), 'b=x')
+
+    def test_openstack_dashboard_conf_no_cache(self):
+        renderer, out_dir = self._renderer({}, tmpl_dir=TEMPLATES_DIR)
+        conf = os.path.join(out_dir, 'openstack-dashboard.conf')
+        for release in ['essex', 'havana', 'newton']:
+            renderer.set_release(release)
+            renderer.register(conf, [StaticContext(
+                static_max_age=0, static_immutable_max_age=31536000)])
+            self.assertIn('Header set Cache-Control "no-cache"',
+                          renderer.render(conf))
+            renderer.register(conf, [StaticContext(
+                static_max_age=3600, static_immutable_max_age=31536000)])
+            self.assertNotIn('no-cache', renderer.render(conf))
+
+    def test_local_settings_memcached_socket(self):
+        renderer, out_dir = self._renderer({}, tmpl_dir=TEMPLATES_DIR)
+        conf = os.path.join(out_dir, 'local_settings.py')
+        self.test_config.set('memcached-socket', True)
+        with patch.object(horizon_utils.horizon_contexts, 'config',
+                          self.test_config.get):
+            for release in ['essex', 'folsom']:
+                renderer.set_release(release)
+                renderer.register(conf, [horizon_utils.horizon_contexts
+                                         .CacheContext()])
+                settings = renderer.render(conf)
+                self.assertIn("'LOCATION' : "
+                              "'unix:/var/lib/memcached/memcached.sock'",
+                              settings)
+                self.assertNotIn('CACHE_BACKEND', settings)
+
+    def test_local_settings_log_queue(self):
+        renderer, out_dir = self._renderer({}, tmpl_dir=TEMPLATES_DIR)
+        conf = os.path.join(out_dir, 'local_settings.py')
+        for release in ['mitaka', 'newton']:
+            renderer.set_release(release)
+            renderer.register(conf, [StaticContext(
+                log_queue=True, use_syslog=True,
+                log_levels=[('novaclient', 'DEBUG')])])
+            settings = renderer.render(conf)
+            # the logging setup only needs the standard library, unlike the
+            # rest of the file
+            start = settings.index('import atexit')
+            end = settings.index("# 'direction' should not be specified")
+            targets = []
+
+            def syslog_handler():
+                targets.append(logging.handlers.BufferingHandler(100))
+                return targets[-1]
+
+            namespace = {'SysLogHandler': syslog_handler}
+            exec(settings[start:end], namespace)
+            for name in namespace['LOGGING']['loggers']:
+                self.addCleanup(setattr, logging.getLogger(name),
+                                'handlers', [])
+            logging.config.dictConfig(namespace['LOGGING'])
+            queue_handler = namespace['_QueueHandler']
+            self.assertTrue(queue_handler.listener.is_alive())
+
+            logging.getLogger('horizon').info('%s logged', 'message')
+            queue_handler._flush()
+            self.assertFalse(queue_handler.listener.is_alive())
+            record = targets[0].buffer[0]
+            self.assertEqual(record.getMessage(), 'message logged')
+            self.assertEqual(record.args, None)
+            if release == 'newton':
+                # the operation log is formatted by its syslog target
+                self.assertEqual(targets[1].formatter._fmt,
+                                 '%(asctime)s %(message)s')
+
+    def test_renderer_distinct_contexts(self):
+        renderer, out_dir = self._renderer({'a.conf': 'a={{ value }}',
+                                            'b.conf': 'b={{ value }}'})
+        b = os.path.join(out_dir, 'b.conf')
+        renderer.register(os.path.join(out_dir, 'a.conf'),
+                          [CountingContext('x')])
+        renderer.register(b, CountingContext('y'))
+        renderer.write_all()
+        self.assertEqual(CountingContext.calls, 2)
+        with open(b) as f:
+            self.assertEqual(f.read(), 'b=y')
+
+    def test_renderer_cache_flushed_by_relation_set(self):
+        renderer, out_dir = self._renderer({'a.conf': 'a={{ value }}'})
+        a = os.path.join(out_dir, 'a.conf')
+        renderer.register(a, [CountingContext('x')])
+        renderer.write(a)
+        renderer.write(a)
+        self.assertEqual(CountingContext.calls, 1)
+        # relation_set() flushes cache entries naming the local unit
+        hookenv.flush('openstack-dashboard/0')
+        renderer.write(a)
+        self.assertEqual(CountingContext.calls, 2)
+        renderer.invalidate()
+        renderer.write(a)
+        self.assertEqual(CountingContext.calls, 3)
+
+    def test_renderer_skips_unchanged_files(self):
+        renderer, out_dir = self._renderer({'a.conf': 'a={{ value }}'})
+        a = os.path.join(out_dir, 'a.conf')
+        renderer.register(a, [CountingContext('x')])
+        renderer.write(a)
+        self.assertEqual(horizon_utils.CHANGED_FILES, [a])
+        os.utime(a, (0, 0))
+        renderer.write(a)
+        self.assertEqual(os.stat(a).st_mtime, 0)
+        self.assertEqual(horizon_utils.CHANGED_FILES, [a])
+        with open(a, 'w') as f:
+            f.write('a=y')
+        renderer.write(a)
+        with open(a) as f:
+            self.assertEqual(f.read(), 'a=x')
+        self.assertEqual(horizon_utils.CHANGED_FILES, [a, a])
+
+    @patch.object(horizon_utils, 'is_unit_paused_set')
+    @patch.object(horizon_utils, 'path_hash')
+    @patch.object(horizon_utils, 'service')
+    def test_restart_on_change_rendered(self, _service, _hash, _paused):
+        _paused.return_value = False
+        _hash.side_effect = ['abc', 'abc']
+        self.addCleanup(horizon_utils.CHANGED_FILES.__delitem__, slice(None))
+        restart_map = OrderedDict([
+            (horizon_utils.LOCAL_SETTINGS, ['apache2']),
+            (horizon_utils.HAPROXY_CONF, ['haproxy']),
+            ('/etc/haproxy/dashboard.pem', ['haproxy']),
+        ])
+
+        @horizon_utils.restart_on_change(restart_map)
+        def hook():
+            horizon_utils.CHANGED_FILES.append(horizon_utils.LOCAL_SETTINGS)
+
+        hook()
+        # only the non-templated file is hashed
+        _hash.assert_has_calls([call('/etc/haproxy/dashboard.pem')] * 2)
+        _service.assert_called_once_with('restart', 'apache2')
+
+    def test_renderer_write_atomic(self):
+        renderer, out_dir = self._renderer({'a.conf': 'a={{ value }}',
+                                            'b.conf': 'b={{ value }}'})
+        a = os.path.join(out_dir, 'a.conf')
+        b = os.path.join(out_dir, 'b.conf')
+        renderer.register(a, [CountingContext('x')])
+        renderer.register(b, [CountingContext('x')])
+        with open(a, 'w') as f:
+            f.write('old')
+        os.chmod(a, 0o640)
+        inode = os.stat(a).st_ino
+        with patch.object(horizon_utils.os, 'chown') as _chown:
+            renderer.write_all()
+        st = os.stat(a)
+        # replaced by rename, keeping owner and mode
+        self.assertNotEqual(st.st_ino, inode)
+        self.assertEqual(st.st_mode & 0o7777, 0o640)
+        _chown.assert_called_once_with(ANY, st.st_uid, st.st_gid)
+        self.assertEqual(os.stat(b).st_mode & 0o7777, 0o644)
+        self.assertEqual(sorted(os.listdir(out_dir)), ['a.conf', 'b.conf'])
+
+    def test_renderer_write_atomic_symlink(self):
+        renderer, out_dir = self._renderer({'a.conf': 'a={{ value }}'})
+        a = os.path.join(out_dir, 'a.conf')
+        target = os.path.join(out_dir, 'target.conf')
+        with open(target, 'w') as f:
+            f.write('old')
+        os.symlink(target, a)
+        renderer.register(a, [CountingContext('x')])
+        renderer.write(a)
+        self.assertTrue(os.path.islink(a))
+        with open(target) as f:
+            self.assertEqual(f.read(), 'a=x')
+        self.assertEqual(sorted(os.listdir(out_dir)),
+                         ['a.conf', 'target.conf'])
+
+    def test_renderer_write_atomic_failure(self):
+        renderer, out_dir = self._renderer({'a.conf': 'a={{ value }}'})
+        a = os.path.join(out_dir, 'a.conf')
+        renderer.register(a, [CountingContext('x')])
+        with open(a, 'w') as f:
+            f.write('old')
+        with patch.object(horizon_utils.os, 'rename') as _rename:
+            _rename.side_effect = OSError
+            self.assertRaises(OSError, renderer.write, a)
+        with open(a) as f:
+            self.assertEqual(f.read(), 'old')
+        self.assertEqual(os.listdir(out_dir), ['a.conf'])
+        self.assertEqual(horizon_utils.CHANGED_FILES, [])
+
+    def test_renderer_bytecode_cache(self):
+        renderer, out_dir = self._renderer({'a.conf': 'a={{ value }}'})
+        a = os.path.join(out_dir, 'a.conf')
+        renderer.register(a, [CountingContext('x')])
+        horizon_utils.charm_dir.return_value = out_dir
+        renderer.write(a)
+        cache_dir = os.path.join(out_dir, horizon_utils.TEMPLATE_CACHE)
+        self.assertEqual(len(os.listdir(cache_dir)), 1)
+        # a fresh environment loads the compiled template from the cache
+        renderer.set_release('newton')
+        with patch('jinja2.environment.Environment.compile') as _compile:
+            self.assertEqual(renderer.render(a), 'a=x')
+            self.assertFalse(_compile.called)
+
+    def _templates(self):
+        templates_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, templates_dir)
+        for name, content in [('a.conf', 'a={{ value }}'),
+                              ('mitaka/b.conf', 'b={{ value }}'),
+                              ('newton/b.conf', 'b2={{ value }}')]:
+            path = os.path.join(templates_dir, name)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as f:
+                f.write(content)
+        charm_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, charm_dir)
+        return templates_dir, os.path.join(charm_dir,
+                                           horizon_utils.TEMPLATE_CACHE)
+
+    @patch.object(horizon_utils, 'CONFIG_FILES',
+                  ['/etc/a.conf', '/etc/b.conf', '/etc/c.conf'])
+    @patch.object(horizon_utils, 'charm_dir')
+    def test_precompile_templates(self, _charm_dir):
+        templates_dir, cache_dir = self._templates()
+        _charm_dir.return_value = os.path.dirname(cache_dir)
+        self.test_config.set('precompile-templates', True)
+        self.config.side_effect = self.test_config.get
+        horizon_utils.precompile_templates(templates_dir)
+        # a.conf plus each release's b.conf; c.conf is not shipped
+        self.assertEqual(len(os.listdir(cache_dir)), 3)
+
+    @patch.object(horizon_utils, 'charm_dir')
+    def test_precompile_templates_disabled(self, _charm_dir):
+        templates_dir, cache_dir = self._templates()
+        _charm_dir.return_value = os.path.dirname(cache_dir)
+        os.makedirs(cache_dir)
+        open(os.path.join(cache_dir, '__jinja2_stale.cache'), 'w').close()
+        self.config.side_effect = self.test_config.get
+        horizon_utils.precompile_templates(templates_dir)
+        self.assertEqual(os.listdir(cache_dir), [])
+
+    def test_lazy_config_renderer(self):
+        factory = MagicMock()
+        configs = horizon_utils.LazyConfigRenderer(factory)
+        self.assertFalse(factory.called)
+        configs.write_all()
+        configs.write('/etc/foo')
+        factory.assert_called_once_with()
+        factory.return_value.write_all.assert_called_once_with()
+        factory.return_value.write.assert_called_once_with('/etc/foo')